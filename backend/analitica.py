@@ -0,0 +1,315 @@
+# Analítica columnar sobre instantáneas de la base de estudiantes.
+# Cada instantánea es un directorio con una columna por archivo .npy y un
+# meta.json con los diccionarios de texto. Al leerla, las columnas se abren con
+# memoria mapeada (varios procesos comparten las mismas páginas) y los GROUP BY
+# se hacen con np.bincount sobre códigos enteros.
+# Este módulo no tiene efectos al importarse.
+import datetime
+import json
+import os
+import shutil
+import time
+import uuid
+
+import numpy as np
+
+import consultas
+
+PUNTERO = "actual"  # archivo con el nombre de la instantánea vigente
+BLOQUE_LECTURA = 50000  # filas por fetchmany al crear la instantánea
+SIN_VALOR = -1  # código de los textos NULL (materias sin estudiante) y de los enteros inválidos
+
+# Columnas de cada instantánea y su tipo; los textos se guardan como códigos
+COLUMNAS = {
+    "estudiantes_carrera": np.int32,
+    "estudiantes_semestre": np.int16,
+    "materias_nombre": np.int32,
+    "materias_nota": np.float64,
+    "materias_anio": np.int16,
+    "materias_semestre": np.int16,
+    "materias_carrera": np.int32,
+    "materias_archivada": np.bool_,
+}
+
+# Límites inferiores de los rangos de DISTRIBUCION_NOTAS, de menor a mayor
+LIMITES_NOTAS = [10, 15, 18]
+RANGOS_NOTAS = ["Reprobado (0-9)", "Aprobado (10-14)", "Bueno (15-17)", "Excelente (18-20)"]
+
+# ---------- CREACIÓN ----------
+def codificar(valores, codigos):
+    """Integer codes for text values; codigos (text -> code) grows as needed."""
+    return np.fromiter(
+        (SIN_VALOR if valor is None else codigos.setdefault(valor, len(codigos)) for valor in valores),
+        dtype=np.int32, count=len(valores)
+    )
+
+def enteros(valores, tipo):
+    """Integer column; values that aren't integers within tipo's range become SIN_VALOR.
+
+    The semestre column is TEXT and the registration form accepts any text.
+    """
+    try:
+        return np.array(valores, dtype=tipo)
+    except (TypeError, ValueError, OverflowError):
+        pass
+    limites = np.iinfo(tipo)
+
+    def entero(valor):
+        try:
+            numero = int(valor)
+        except (TypeError, ValueError, OverflowError):
+            return SIN_VALOR
+        return numero if limites.min <= numero <= limites.max else SIN_VALOR
+
+    return np.fromiter((entero(valor) for valor in valores), dtype=tipo, count=len(valores))
+
+def reales(valores):
+    """Float column; NULL and non-numeric values become NaN."""
+    try:
+        return np.array(valores, dtype=np.float64)
+    except (TypeError, ValueError):
+        pass
+
+    def real(valor):
+        try:
+            return float(valor)
+        except (TypeError, ValueError):
+            return np.nan
+
+    return np.fromiter((real(valor) for valor in valores), dtype=np.float64, count=len(valores))
+
+def ordenar_codigos(codigos, *columnas):
+    """Renumber codes in place so they follow text order; returns the sorted texts."""
+    etiquetas = sorted(codigos)
+    # La última posición deja SIN_VALOR (-1) como está
+    nuevos = np.empty(len(etiquetas) + 1, dtype=np.int32)
+    for indice, etiqueta in enumerate(etiquetas):
+        nuevos[codigos[etiqueta]] = indice
+    nuevos[-1] = SIN_VALOR
+    for columna in columnas:
+        columna[:] = nuevos[columna]
+    return etiquetas
+
+def bloques(cursor):
+    while True:
+        filas = cursor.fetchmany(BLOQUE_LECTURA)
+        if not filas:
+            return
+        yield list(zip(*filas))
+
+def crear_instantanea(conn, directorio):
+    """Write a new snapshot under directorio and make it the current one; returns its metadata.
+
+    conn must come from get_students_db_historico(). Every read runs in one
+    transaction, so all columns see the same state of the database.
+    """
+    inicio = time.time()
+    partes = {nombre: [] for nombre in COLUMNAS}
+    carreras, materias = {}, {}
+
+    conn.execute("BEGIN")
+    try:
+        for carrera, semestre in bloques(conn.execute(consultas.INSTANTANEA_ESTUDIANTES)):
+            partes["estudiantes_carrera"].append(codificar(carrera, carreras))
+            partes["estudiantes_semestre"].append(enteros(semestre, np.int16))
+
+        for archivada, esquema in enumerate(("main", "archivo")):
+            for nombre, nota, anio, semestre, carrera in bloques(conn.execute(consultas.INSTANTANEA_MATERIAS[esquema])):
+                partes["materias_nombre"].append(codificar(nombre, materias))
+                partes["materias_nota"].append(reales(nota))
+                partes["materias_anio"].append(enteros(anio, np.int16))
+                partes["materias_semestre"].append(enteros(semestre, np.int16))
+                partes["materias_carrera"].append(codificar(carrera, carreras))
+                partes["materias_archivada"].append(np.full(len(nombre), bool(archivada)))
+
+        total_evaluaciones = conn.execute(consultas.TOTAL_EVALUACIONES).fetchone()[0]
+        # Último cambio que la instantánea ya incluye (ver change_log)
+        ultimo_cambio = conn.execute(consultas.ULTIMO_CAMBIO).fetchone()[0]
+    finally:
+        conn.rollback()
+
+    columnas = {
+        nombre: np.concatenate(partes[nombre]) if partes[nombre] else np.empty(0, dtype=tipo)
+        for nombre, tipo in COLUMNAS.items()
+    }
+    meta = {
+        "creada": inicio,
+        "carreras": ordenar_codigos(carreras, columnas["estudiantes_carrera"], columnas["materias_carrera"]),
+        "materias": ordenar_codigos(materias, columnas["materias_nombre"]),
+        "total_evaluaciones": total_evaluaciones,
+        "ultimo_cambio": ultimo_cambio,
+        "filas": {
+            "estudiantes": len(columnas["estudiantes_carrera"]),
+            "materias": len(columnas["materias_nombre"]),
+        },
+    }
+
+    # Se escribe en un directorio nuevo y se cambia el puntero: los lectores
+    # ven la instantánea anterior o la nueva completa, nunca una a medias
+    os.makedirs(directorio, exist_ok=True)
+    version = datetime.datetime.fromtimestamp(inicio).strftime("%Y%m%d-%H%M%S-") + uuid.uuid4().hex[:6]
+    temporal = os.path.join(directorio, version + ".tmp")
+    os.makedirs(temporal)
+    for nombre, columna in columnas.items():
+        np.save(os.path.join(temporal, nombre + ".npy"), columna)
+    meta["duracion"] = round(time.time() - inicio, 3)
+    with open(os.path.join(temporal, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False)
+    os.rename(temporal, os.path.join(directorio, version))
+
+    puntero = os.path.join(directorio, PUNTERO)
+    with open(puntero + ".tmp", "w", encoding="utf-8") as f:
+        f.write(version)
+    os.replace(puntero + ".tmp", puntero)
+
+    # En Windows no se borra lo que otro proceso tenga mapeado; queda para la próxima
+    for entrada in os.listdir(directorio):
+        if entrada not in (version, PUNTERO):
+            shutil.rmtree(os.path.join(directorio, entrada), ignore_errors=True)
+
+    return meta
+
+# ---------- LECTURA ----------
+def cargar_instantanea(directorio):
+    """Current snapshot in directorio, or None if there is none (or it was just replaced)."""
+    try:
+        with open(os.path.join(directorio, PUNTERO), encoding="utf-8") as f:
+            version = f.read().strip()
+        return Instantanea(os.path.join(directorio, version))
+    except (OSError, ValueError):
+        return None
+
+def agrupar(codigos, grupos, valores=None):
+    """Vectorised GROUP BY: row count per code and, given valores, their sums."""
+    conteo = np.bincount(codigos, minlength=grupos)
+    if valores is None:
+        return conteo
+    return conteo, np.bincount(codigos, weights=valores, minlength=grupos)
+
+class Instantanea:
+    """Read-only, memory-mapped view of one snapshot directory."""
+
+    def __init__(self, ruta):
+        with open(os.path.join(ruta, "meta.json"), encoding="utf-8") as f:
+            self.meta = json.load(f)
+        self.version = os.path.basename(ruta)
+        self.columnas = {
+            nombre: np.load(os.path.join(ruta, nombre + ".npy"), mmap_mode="r")
+            for nombre in COLUMNAS
+        }
+        self.carreras = self.meta["carreras"]
+        self.materias = self.meta["materias"]
+
+    def edad(self):
+        return time.time() - self.meta["creada"]
+
+    def ultimo_cambio(self):
+        # Las instantáneas anteriores a este campo no saben hasta qué cambio llegan
+        return self.meta.get("ultimo_cambio", -1)
+
+    def info(self):
+        return {
+            "version": self.version,
+            "creada": datetime.datetime.fromtimestamp(self.meta["creada"]).strftime("%Y-%m-%d %H:%M:%S"),
+            "edad": round(self.edad(), 1),
+            "duracion": self.meta.get("duracion"),
+            "filas": self.meta["filas"],
+        }
+
+    def estadisticas(self):
+        """Same payload as the SQL path of /api/estadisticas (active terms only)."""
+        c = self.columnas
+        nota = c["materias_nota"]
+        con_nota = ~c["materias_archivada"] & ~np.isnan(nota)
+        notas = nota[con_nota]
+
+        conteo = agrupar(c["estudiantes_carrera"], len(self.carreras))
+        # Cantidad descendente; a igual cantidad, por nombre de carrera
+        por_carrera = [
+            {"carrera": self.carreras[i], "cantidad": int(conteo[i])}
+            for i in np.argsort(-conteo, kind="stable") if conteo[i]
+        ]
+
+        # Los semestres que no son un número quedan fuera del desglose, no del total
+        semestre = c["estudiantes_semestre"]
+        semestres, cantidades = np.unique(semestre[semestre != SIN_VALOR], return_counts=True)
+
+        con_carrera = con_nota & (c["materias_carrera"] != SIN_VALOR)
+        conteo, suma = agrupar(c["materias_carrera"][con_carrera], len(self.carreras), nota[con_carrera])
+        promedio_por_carrera = [
+            {"carrera": self.carreras[i], "promedio": round(float(suma[i] / conteo[i]), 2)}
+            for i in np.flatnonzero(conteo)
+        ]
+
+        conteo, suma = agrupar(c["materias_nombre"][con_nota], len(self.materias), notas)
+        con_filas = np.flatnonzero(conteo)
+        promedios = suma[con_filas] / conteo[con_filas]
+        materias_dificiles = [
+            {"nombre": self.materias[i], "promedio": round(float(suma[i] / conteo[i]), 2), "estudiantes": int(conteo[i])}
+            for i in con_filas[np.argsort(promedios, kind="stable")][:5]
+        ]
+
+        rangos = agrupar(np.digitize(notas, LIMITES_NOTAS), len(RANGOS_NOTAS))
+        distribucion_notas = [
+            {"rango": RANGOS_NOTAS[i], "cantidad": int(rangos[i])}
+            for i in reversed(range(len(RANGOS_NOTAS))) if rangos[i]
+        ]
+
+        return {
+            "total_estudiantes": len(c["estudiantes_carrera"]),
+            "total_materias": int(np.count_nonzero(~c["materias_archivada"])),
+            "total_evaluaciones": self.meta["total_evaluaciones"],
+            "promedio_general": round(float(notas.mean()), 2) if len(notas) else 0,
+            "estudiantes_por_carrera": por_carrera,
+            "estudiantes_por_semestre": [
+                {"semestre": int(semestre), "cantidad": int(cantidad)}
+                for semestre, cantidad in zip(semestres, cantidades)
+            ],
+            "promedio_por_carrera": promedio_por_carrera,
+            "materias_dificiles": materias_dificiles,
+            "distribucion_notas": distribucion_notas,
+        }
+
+    def tendencias(self, por, nota_aprobatoria, materia=None, carrera=None):
+        """Average final grade per year for each subject (por='materia') or career (por='carrera').
+
+        Covers active and archived terms; materia and carrera narrow the rows.
+        """
+        c = self.columnas
+        nota = c["materias_nota"]
+        filtro = ~np.isnan(nota) & (c["materias_anio"] > 0)
+        for valor, etiquetas, columna in ((materia, self.materias, "materias_nombre"),
+                                          (carrera, self.carreras, "materias_carrera")):
+            if valor is None:
+                continue
+            if valor not in etiquetas:
+                return []
+            filtro &= c[columna] == etiquetas.index(valor)
+        if por == "carrera":
+            filtro &= c["materias_carrera"] != SIN_VALOR
+        if not filtro.any():
+            return []
+
+        etiquetas = self.materias if por == "materia" else self.carreras
+        grupo = c["materias_nombre" if por == "materia" else "materias_carrera"][filtro].astype(np.int64)
+        anios = c["materias_anio"][filtro]
+        notas = nota[filtro]
+
+        # Clave compuesta (grupo, año) en un solo entero para un único bincount
+        primer_anio = int(anios.min())
+        cantidad_anios = int(anios.max()) - primer_anio + 1
+        claves = grupo * cantidad_anios + (anios - primer_anio)
+        grupos = len(etiquetas) * cantidad_anios
+        conteo, suma = agrupar(claves, grupos, notas)
+        aprobadas = agrupar(claves[notas >= nota_aprobatoria], grupos)
+
+        return [
+            {
+                por: etiquetas[clave // cantidad_anios],
+                "año": primer_anio + int(clave % cantidad_anios),
+                "promedio": round(float(suma[clave] / conteo[clave]), 2),
+                "materias": int(conteo[clave]),
+                "aprobadas": int(aprobadas[clave]),
+            }
+            for clave in np.flatnonzero(conteo)
+        ]
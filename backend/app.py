@@ -1,18 +1,61 @@
-from flask import Flask, request, redirect, render_template, session
-from werkzeug.security import check_password_hash
+from flask import Flask, request, redirect, session, Response
+from flask.json.provider import DefaultJSONProvider
+from flask.sessions import SessionInterface, SessionMixin
+from werkzeug.datastructures import CallbackDict
+from werkzeug.security import check_password_hash, generate_password_hash
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, TimeoutError as FuturesTimeoutError
+from collections import OrderedDict, deque
+from functools import wraps
+import csv
+import gzip
+import hashlib
+import datetime
+import glob
+import io
+import json
+import math
+import multiprocessing
+import re
+import secrets
 import sqlite3
 import os
 import sys
-import unicodedata
+import threading
+import time
+import uuid
 
-# Función para normalizar texto removiendo tildes/acentos
-def normalizar_texto(texto):
-    """Remove accents/tildes from text for normalization."""
-    if not texto:
-        return texto
-    # Normalize to NFD (decomposed form), then filter out combining marks
-    normalized = unicodedata.normalize('NFD', str(texto))
-    return ''.join(c for c in normalized if unicodedata.category(c) != 'Mn')
+import consultas
+from importacion import (
+    CAMPO_VACIO, campo_faltante, columnas_csv, filas_de_dataframe, fusionar_grupos,
+    leer_archivo, planificar_fragmentos_csv, procesar_fragmento
+)
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import analitica  # requiere numpy
+except ImportError:
+    analitica = None
+
+# En un ejecutable congelado, los procesos del pool de importación vuelven a
+# ejecutar este archivo: freeze_support() los desvía al trabajo del pool antes
+# de que lleguen a abrir bases de datos o a levantar el servidor
+if __name__ == "__main__":
+    multiprocessing.freeze_support()
+
+# Los procesos del pool (spawn) importan este módulo como __mp_main__; las
+# bases, los assets y los hilos de fondo solo se inician en el proceso principal
+ES_PROCESO_PRINCIPAL = (
+    multiprocessing.parent_process() is None and "--multiprocessing-fork" not in sys.argv
+)
 
 # Rutas base
 # Si está congelado (ejecutable), sys.executable es la ruta base para archivos mutables (DBs)
@@ -26,6 +69,8 @@ else:
 
 DB_NAME = os.path.join(BASE_DIR, "database.db")
 STUDENTS_DB = os.path.join(BASE_DIR, "base_datos_estudiantes.db")
+ARCHIVE_DB = os.path.join(BASE_DIR, "base_datos_archivo.db")
+CREDENCIALES_MARCA = os.path.join(BASE_DIR, "credenciales.marca")
 
 # Configuración de Flask
 app = Flask(
@@ -48,88 +93,1095 @@ def get_students_db():
     conn.row_factory = sqlite3.Row
     return conn
 
+def get_students_db_historico():
+    """Students DB with the archive attached and views spanning hot and cold rows."""
+    conn = get_students_db()
+    conn.execute("ATTACH DATABASE ? AS archivo", (ARCHIVE_DB,))
+    for vista in consultas.VISTAS_HISTORICO:
+        conn.execute(vista)
+    return conn
+
 def init_db():
     conn = sqlite3.connect(DB_NAME)
-    conn.execute("""
-    CREATE TABLE IF NOT EXISTS users (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        email TEXT UNIQUE NOT NULL,
-        password_hash TEXT NOT NULL,
-        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-    )
-    """)
+    consultas.crear_esquema(conn, consultas.ESQUEMA_USUARIOS)
     conn.commit()
     conn.close()
 
 def init_students_db():
     conn = sqlite3.connect(STUDENTS_DB)
     
-    # Tabla principal de estudiantes
-    conn.execute("""
-    CREATE TABLE IF NOT EXISTS estudiantes (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        nombre TEXT NOT NULL,
-        apellido TEXT NOT NULL,
-        fecha_nacimiento TEXT NOT NULL,
-        telefono TEXT NOT NULL,
-        correo TEXT NOT NULL,
-        carrera TEXT NOT NULL,
-        semestre INTEGER NOT NULL,
-        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    # WAL deja leer mientras se escribe o se respalda. auto_vacuum solo cambia
+    # en una base existente después de un VACUUM, que se hace una única vez
+    conn.execute("PRAGMA journal_mode=WAL")
+    if conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+        conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        conn.execute("VACUUM")
+    
+    # Tablas, índices y columnas agregadas: ver consultas.ESQUEMA_ESTUDIANTES
+    consultas.crear_esquema(conn, consultas.ESQUEMA_ESTUDIANTES)
+    conn.commit()
+    conn.close()
+
+def init_archive_db():
+    conn = sqlite3.connect(ARCHIVE_DB)
+    conn.execute("PRAGMA journal_mode=WAL")
+    consultas.crear_esquema(conn, consultas.ESQUEMA_ARCHIVO)
+    conn.commit()
+    conn.close()
+
+if ES_PROCESO_PRINCIPAL:
+    init_db()
+    init_students_db()
+    init_archive_db()
+
+# ---------- AUTENTICACIÓN ----------
+# El KDF de werkzeug es costoso en CPU: se verifica en un pool acotado para que
+# una ráfaga de inicios de sesión no acapare todos los workers de la API
+HASH_WORKERS = 2
+HASH_TIMEOUT = 10  # segundos
+hash_pool = ThreadPoolExecutor(max_workers=HASH_WORKERS, thread_name_prefix="hash")
+
+# Caché de usuarios por correo: email -> (expira, id, password_hash).
+# Con varios workers, cada proceso tiene su propia caché: un cambio de
+# credenciales reescribe CREDENCIALES_MARCA y los demás la vacían al notarlo
+USUARIOS_CACHE_TTL = 300  # segundos
+usuarios_cache = {}
+usuarios_cache_lock = threading.Lock()
+usuarios_cache_marca = None
+
+# Intentos fallidos: clave -> (cantidad, inicio_ventana). El bloqueo es por
+# correo; por IP el umbral es mucho mayor, porque un aula entera puede salir
+# por la misma dirección (NAT del campus)
+MAX_INTENTOS_FALLIDOS = 5
+MAX_INTENTOS_POR_IP = 100
+VENTANA_INTENTOS = 300  # segundos
+MAX_CLAVES_INTENTOS = 10000
+intentos_fallidos = {}
+intentos_lock = threading.Lock()
+
+def leer_marca_credenciales():
+    try:
+        with open(CREDENCIALES_MARCA, encoding="utf-8") as f:
+            return f.read()
+    except OSError:
+        return None
+
+def buscar_usuario(email):
+    """Return (id, password_hash) for an email, using the in-memory cache."""
+    global usuarios_cache_marca
+    ahora = time.monotonic()
+    marca = leer_marca_credenciales()
+    with usuarios_cache_lock:
+        if marca != usuarios_cache_marca:
+            usuarios_cache.clear()
+            usuarios_cache_marca = marca
+        cacheado = usuarios_cache.get(email)
+        if cacheado and cacheado[0] > ahora:
+            return cacheado[1], cacheado[2]
+
+    conn = get_db()
+    user = conn.execute(consultas.USUARIO_POR_EMAIL, (email,)).fetchone()
+    conn.close()
+
+    if not user:
+        return None
+
+    with usuarios_cache_lock:
+        usuarios_cache[email] = (ahora + USUARIOS_CACHE_TTL, user["id"], user["password_hash"])
+    return user["id"], user["password_hash"]
+
+def invalidar_usuario_cache(email=None):
+    """Drop a cached user (or the whole cache) after its credentials change.
+
+    Rewrites CREDENCIALES_MARCA so that other worker processes drop theirs too.
+    """
+    with usuarios_cache_lock:
+        if email is None:
+            usuarios_cache.clear()
+        else:
+            usuarios_cache.pop(email, None)
+    try:
+        with open(CREDENCIALES_MARCA, "w", encoding="utf-8") as f:
+            f.write(uuid.uuid4().hex)
+    except OSError:
+        pass
+
+def verificar_password(password_hash, password):
+    """Check a password hash on the bounded pool; None if the pool timed out."""
+    futuro = hash_pool.submit(check_password_hash, password_hash, password)
+    try:
+        return futuro.result(timeout=HASH_TIMEOUT)
+    except FuturesTimeoutError:
+        futuro.cancel()
+        return None
+
+def claves_intento(email):
+    """(key, limit) pairs for a login attempt: strict per email, loose per IP."""
+    return (
+        ("email:" + email.lower(), MAX_INTENTOS_FALLIDOS),
+        ("ip:" + (request.remote_addr or ""), MAX_INTENTOS_POR_IP),
     )
-    """)
-    
-    # Tabla de semestres cursados por estudiante
-    conn.execute("""
-    CREATE TABLE IF NOT EXISTS semesters (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        student_id INTEGER NOT NULL,
-        semestre INTEGER NOT NULL,
-        año INTEGER NOT NULL,
-        estado TEXT DEFAULT 'activo',
-        FOREIGN KEY (student_id) REFERENCES estudiantes(id)
+
+def esta_bloqueado(claves):
+    ahora = time.monotonic()
+    with intentos_lock:
+        for clave, limite in claves:
+            registro = intentos_fallidos.get(clave)
+            if not registro:
+                continue
+            cantidad, inicio = registro
+            if ahora - inicio > VENTANA_INTENTOS:
+                del intentos_fallidos[clave]
+            elif cantidad >= limite:
+                return True
+    return False
+
+def registrar_intento_fallido(claves):
+    ahora = time.monotonic()
+    with intentos_lock:
+        # Evitar que el contador crezca sin límite ante muchos clientes distintos
+        if len(intentos_fallidos) >= MAX_CLAVES_INTENTOS:
+            for clave, (_, inicio) in list(intentos_fallidos.items()):
+                if ahora - inicio > VENTANA_INTENTOS:
+                    del intentos_fallidos[clave]
+            if len(intentos_fallidos) >= MAX_CLAVES_INTENTOS:
+                intentos_fallidos.clear()
+
+        for clave, _ in claves:
+            cantidad, inicio = intentos_fallidos.get(clave, (0, ahora))
+            if ahora - inicio > VENTANA_INTENTOS:
+                cantidad, inicio = 0, ahora
+            intentos_fallidos[clave] = (cantidad + 1, inicio)
+
+def limpiar_intentos(claves):
+    # Solo se limpia el contador del correo: un acierto no absuelve a la IP
+    with intentos_lock:
+        intentos_fallidos.pop(claves[0][0], None)
+
+# ---------- SESIONES DEL LADO DEL SERVIDOR ----------
+SESION_DURACION = 8 * 60 * 60  # segundos de inactividad antes de expirar
+SESION_CACHE_CAPACIDAD = 1024
+SESION_CACHE_TTL = 30  # segundos antes de revalidar una sesión contra SQLite
+SESION_PURGA_INTERVALO = 10 * 60  # segundos entre barridos de sesiones expiradas
+
+class AlmacenSesionesSQLite:
+    """Session backend stored in the `sesiones` table of database.db."""
+
+    def obtener(self, sid):
+        conn = get_db()
+        fila = conn.execute(consultas.SESION_POR_ID, (sid,)).fetchone()
+        conn.close()
+        if not fila or fila["expira"] <= time.time():
+            return None
+        return json.loads(fila["datos"]), fila["expira"]
+
+    def guardar(self, sid, datos, expira):
+        conn = get_db()
+        conn.execute(
+            consultas.GUARDAR_SESION,
+            (sid, json.dumps(datos), expira)
+        )
+        conn.commit()
+        conn.close()
+
+    def eliminar(self, sid):
+        conn = get_db()
+        conn.execute(consultas.ELIMINAR_SESION, (sid,))
+        conn.commit()
+        conn.close()
+
+    def purgar_expiradas(self):
+        conn = get_db()
+        cursor = conn.execute(consultas.PURGAR_SESIONES, (time.time(),))
+        conn.commit()
+        conn.close()
+        return cursor.rowcount
+
+    def contar_activas(self):
+        conn = get_db()
+        total = conn.execute(consultas.CONTAR_SESIONES_ACTIVAS, (time.time(),)).fetchone()["total"]
+        conn.close()
+        return total
+
+class AlmacenSesionesCache:
+    """LRU cache in front of another session backend."""
+
+    def __init__(self, backend, capacidad=SESION_CACHE_CAPACIDAD, ttl=SESION_CACHE_TTL):
+        self.backend = backend
+        self.capacidad = capacidad
+        self.ttl = ttl
+        self.cache = OrderedDict()  # sid -> (datos, expira, revalidar_en)
+        self.lock = threading.Lock()
+
+    def _cachear(self, sid, datos, expira):
+        self.cache[sid] = (datos, expira, time.monotonic() + self.ttl)
+        self.cache.move_to_end(sid)
+        while len(self.cache) > self.capacidad:
+            self.cache.popitem(last=False)
+
+    def obtener(self, sid):
+        with self.lock:
+            entrada = self.cache.get(sid)
+            if entrada:
+                datos, expira, revalidar_en = entrada
+                if expira <= time.time():
+                    del self.cache[sid]
+                    return None
+                if revalidar_en > time.monotonic():
+                    self.cache.move_to_end(sid)
+                    return dict(datos), expira
+
+        resultado = self.backend.obtener(sid)
+        with self.lock:
+            if resultado is None:
+                self.cache.pop(sid, None)
+            else:
+                self._cachear(sid, resultado[0], resultado[1])
+        return resultado
+
+    def guardar(self, sid, datos, expira):
+        self.backend.guardar(sid, datos, expira)
+        with self.lock:
+            self._cachear(sid, dict(datos), expira)
+
+    def eliminar(self, sid):
+        with self.lock:
+            self.cache.pop(sid, None)
+        self.backend.eliminar(sid)
+
+    def purgar_expiradas(self):
+        ahora = time.time()
+        with self.lock:
+            for sid in [sid for sid, entrada in self.cache.items() if entrada[1] <= ahora]:
+                del self.cache[sid]
+        return self.backend.purgar_expiradas()
+
+    def contar_activas(self):
+        return self.backend.contar_activas()
+
+    def contar_en_cache(self):
+        with self.lock:
+            return len(self.cache)
+
+class SesionServidor(CallbackDict, SessionMixin):
+    def __init__(self, datos=None, sid=None, expira=None, nueva=False):
+        def on_update(self):
+            self.modified = True
+        CallbackDict.__init__(self, datos, on_update)
+        self.sid = sid
+        self.expira = expira
+        self.new = nueva
+        self.modified = False
+        self.rotar = False
+
+class InterfazSesionServidor(SessionInterface):
+    """Keeps session state in a server-side store; the cookie only carries an opaque id."""
+
+    def __init__(self, almacen):
+        self.almacen = almacen
+
+    def open_session(self, app, request):
+        sid = request.cookies.get(self.get_cookie_name(app))
+        if sid:
+            resultado = self.almacen.obtener(sid)
+            if resultado is not None:
+                datos, expira = resultado
+                return SesionServidor(datos, sid=sid, expira=expira)
+        return SesionServidor(nueva=True)
+
+    def save_session(self, app, session, response):
+        nombre = self.get_cookie_name(app)
+        dominio = self.get_cookie_domain(app)
+        ruta = self.get_cookie_path(app)
+
+        # Sesión vacía: revocarla en el servidor y borrar la cookie
+        if not session:
+            if session.sid and session.modified:
+                self.almacen.eliminar(session.sid)
+                response.delete_cookie(nombre, domain=dominio, path=ruta)
+            return
+
+        ahora = time.time()
+        if session.rotar and session.sid:
+            self.almacen.eliminar(session.sid)
+            session.sid = None
+
+        # Solo se escribe si cambió algo o si pasó la mitad de la vigencia
+        renovar = session.expira is None or session.expira - ahora < SESION_DURACION / 2
+        if session.sid and not session.modified and not renovar:
+            return
+
+        nueva_cookie = session.sid is None
+        if nueva_cookie:
+            session.sid = secrets.token_urlsafe(32)
+        session.expira = ahora + SESION_DURACION
+        self.almacen.guardar(session.sid, dict(session), session.expira)
+
+        if nueva_cookie or session.permanent:
+            response.set_cookie(
+                nombre,
+                session.sid,
+                expires=self.get_expiration_time(app, session),
+                httponly=self.get_cookie_httponly(app),
+                domain=dominio,
+                path=ruta,
+                secure=self.get_cookie_secure(app),
+                samesite=self.get_cookie_samesite(app),
+            )
+
+def purgar_sesiones_periodicamente(almacen, intervalo=SESION_PURGA_INTERVALO):
+    def ciclo():
+        while True:
+            time.sleep(intervalo)
+            try:
+                almacen.purgar_expiradas()
+            except sqlite3.Error:
+                pass
+    hilo = threading.Thread(target=ciclo, name="purga-sesiones", daemon=True)
+    hilo.start()
+    return hilo
+
+def regenerar_sesion():
+    """Issue a new session id on the next response (e.g. after login)."""
+    session.rotar = True
+
+def login_requerido(f):
+    """Reject anonymous requests: 401 JSON for the API, redirect for pages."""
+    @wraps(f)
+    def decorada(*args, **kwargs):
+        if "user_id" not in session:
+            if request.path.startswith("/api/"):
+                return {"error": "No autorizado"}, 401
+            return redirect("/login.html")
+        return f(*args, **kwargs)
+    return decorada
+
+almacen_sesiones = AlmacenSesionesCache(AlmacenSesionesSQLite())
+app.session_interface = InterfazSesionServidor(almacen_sesiones)
+
+if ES_PROCESO_PRINCIPAL:
+    purgar_sesiones_periodicamente(almacen_sesiones)
+
+# ---------- ASSETS ESTÁTICOS ----------
+# Al iniciar se calcula la huella de cada CSS/JS, se precomprimen (gzip y brotli
+# si está instalado) y las páginas HTML se guardan en memoria ya reescritas
+ASSETS_EXTENSIONES = (".css", ".js")
+ASSETS_CACHE_CONTROL = "public, max-age=31536000, immutable"
+PAGINAS_CACHE_CONTROL = "private, no-cache"
+PAGINAS = ("index.html", "login.html", "base_de_datos.html", "migracion.html", "configuracion.html")
+MIMETYPES = {".css": "text/css", ".js": "application/javascript", ".html": "text/html"}
+
+assets = {}  # nombre con huella -> {"variantes", "mimetype", "etag"}
+manifiesto_assets = {}  # nombre original -> nombre con huella
+paginas = {}  # nombre -> {"variantes", "mimetype", "etag"}
+assets_firma = None
+
+def comprimir_variantes(contenido):
+    variantes = {"identity": contenido, "gzip": gzip.compress(contenido, 9, mtime=0)}
+    if brotli is not None:
+        variantes["br"] = brotli.compress(contenido)
+    return variantes
+
+def firma_frontend():
+    return tuple(
+        (nombre, os.stat(os.path.join(FRONTEND_DIR, nombre)).st_mtime_ns)
+        for nombre in sorted(os.listdir(FRONTEND_DIR))
+        if nombre.endswith(ASSETS_EXTENSIONES) or nombre in PAGINAS
     )
-    """)
-    
-    # Tabla de materias por semestre
-    conn.execute("""
-    CREATE TABLE IF NOT EXISTS subjects (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        semester_id INTEGER NOT NULL,
-        nombre TEXT NOT NULL,
-        nota_final REAL,
-        FOREIGN KEY (semester_id) REFERENCES semesters(id)
+
+def construir_assets():
+    """Fingerprint and precompress CSS/JS, and cache the rewritten HTML pages."""
+    global assets, manifiesto_assets, paginas, assets_firma
+
+    nuevos_assets = {}
+    nuevo_manifiesto = {}
+    for nombre in sorted(os.listdir(FRONTEND_DIR)):
+        if not nombre.endswith(ASSETS_EXTENSIONES):
+            continue
+        with open(os.path.join(FRONTEND_DIR, nombre), "rb") as f:
+            contenido = f.read()
+        huella = hashlib.sha256(contenido).hexdigest()[:12]
+        base, ext = os.path.splitext(nombre)
+        nombre_huella = f"{base}.{huella}{ext}"
+        nuevo_manifiesto[nombre] = nombre_huella
+        nuevos_assets[nombre_huella] = {
+            "variantes": comprimir_variantes(contenido),
+            "mimetype": MIMETYPES[ext],
+            "etag": huella
+        }
+
+    def reescribir(coincidencia):
+        nombre = coincidencia.group(2)
+        if nombre not in nuevo_manifiesto:
+            return coincidencia.group(0)
+        return f'{coincidencia.group(1)}="/assets/{nuevo_manifiesto[nombre]}"'
+
+    nuevas_paginas = {}
+    for nombre in PAGINAS:
+        with open(os.path.join(FRONTEND_DIR, nombre), encoding="utf-8") as f:
+            html = f.read()
+        html = re.sub(r'(href|src)="/?([^"/:]+\.(?:css|js))"', reescribir, html)
+        contenido = html.encode("utf-8")
+        nuevas_paginas[nombre] = {
+            "variantes": comprimir_variantes(contenido),
+            "mimetype": MIMETYPES[".html"],
+            "etag": hashlib.sha256(contenido).hexdigest()[:16]
+        }
+
+    assets, manifiesto_assets, paginas = nuevos_assets, nuevo_manifiesto, nuevas_paginas
+    assets_firma = firma_frontend()
+
+def respuesta_precomprimida(recurso, cache_control):
+    variantes = recurso["variantes"]
+    codificacion = "identity"
+    for candidata in ("br", "gzip"):
+        if candidata in variantes and request.accept_encodings[candidata]:
+            codificacion = candidata
+            break
+
+    resp = app.response_class(variantes[codificacion], mimetype=recurso["mimetype"])
+    if codificacion != "identity":
+        resp.headers["Content-Encoding"] = codificacion
+    resp.headers["Vary"] = "Accept-Encoding"
+    resp.headers["Cache-Control"] = cache_control
+    resp.set_etag(f"{recurso['etag']}-{codificacion}")
+    return resp.make_conditional(request)
+
+def servir_pagina(nombre):
+    # En modo debug se reconstruye si cambió algún archivo del frontend
+    if app.debug and firma_frontend() != assets_firma:
+        construir_assets()
+    return respuesta_precomprimida(paginas[nombre], PAGINAS_CACHE_CONTROL)
+
+def pagina_login_con_mensaje(mensaje, codigo, reintentar=None):
+    """Login page with an error message, for responses that can't redirect (429, 503)."""
+    html = paginas["login.html"]["variantes"]["identity"].decode("utf-8")
+    aviso = f'<p class="login-error" role="alert">{mensaje}</p>'
+    resp = app.response_class(html.replace("<!-- MENSAJE_LOGIN -->", aviso, 1), status=codigo, mimetype="text/html")
+    resp.headers["Cache-Control"] = "no-store"
+    if reintentar:
+        resp.headers["Retry-After"] = str(reintentar)
+    return resp
+
+if ES_PROCESO_PRINCIPAL:
+    construir_assets()
+
+@app.route("/assets/<nombre>")
+def servir_asset(nombre):
+    recurso = assets.get(nombre)
+    if recurso is None:
+        return {"error": "Recurso no encontrado"}, 404
+    return respuesta_precomprimida(recurso, ASSETS_CACHE_CONTROL)
+
+# ---------- SERIALIZACIÓN JSON Y COMPRESIÓN ----------
+# Se usa orjson si está instalado; NaN/NaT de pandas se envían como null
+COMPRESION_UMBRAL = 1024  # bytes
+COMPRESION_NIVEL = 5
+
+def valor_json(obj):
+    """Convert NumPy/pandas scalars and dates into plain JSON values."""
+    # datetime64 con unidad ns se convertiría en un entero al hacer item()/tolist();
+    # en microsegundos da datetime y sale igual que con orjson
+    if getattr(getattr(obj, "dtype", None), "kind", None) == "M":
+        obj = obj.astype("datetime64[us]")
+    if getattr(obj, "ndim", 0) and hasattr(obj, "tolist"):
+        return obj.tolist()
+    # NaN y NaT no son iguales a sí mismos; pd.NA ni siquiera se puede comparar
+    try:
+        if obj != obj:
+            return None
+    except (TypeError, ValueError):
+        return None
+    if hasattr(obj, "item") and not hasattr(obj, "__len__"):
+        obj = obj.item()
+        if isinstance(obj, float) and not math.isfinite(obj):
+            return None
+        if hasattr(obj, "isoformat"):
+            return obj.isoformat()
+        return obj
+    if hasattr(obj, "isoformat"):
+        return obj.isoformat()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+def limpiar_no_finitos(obj):
+    # json de la librería estándar emite NaN/Infinity, que no son JSON válido
+    if isinstance(obj, float):
+        return obj if math.isfinite(obj) else None
+    if isinstance(obj, dict):
+        return {k: limpiar_no_finitos(v) for k, v in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [limpiar_no_finitos(v) for v in obj]
+    return obj
+
+class ProveedorJSON(DefaultJSONProvider):
+    ensure_ascii = False
+    sort_keys = False
+
+    @staticmethod
+    def default(obj):
+        try:
+            return valor_json(obj)
+        except TypeError:
+            return DefaultJSONProvider.default(obj)
+
+    def dumps_bytes(self, obj):
+        if orjson is not None:
+            return orjson.dumps(
+                obj,
+                default=self.default,
+                option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+            )
+        return json.dumps(
+            limpiar_no_finitos(obj), default=self.default,
+            ensure_ascii=False, allow_nan=False
+        ).encode("utf-8")
+
+    def dumps(self, obj, **kwargs):
+        if orjson is not None and not kwargs:
+            return self.dumps_bytes(obj).decode("utf-8")
+        kwargs.setdefault("default", self.default)
+        kwargs.setdefault("ensure_ascii", self.ensure_ascii)
+        kwargs.setdefault("allow_nan", False)
+        return json.dumps(limpiar_no_finitos(obj), **kwargs)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(self.dumps_bytes(obj), mimetype=self.mimetype)
+
+app.json = ProveedorJSON(app)
+
+@app.after_request
+def comprimir_respuesta(response):
+    # Solo JSON grande; los assets ya van precomprimidos y los streams no se tocan
+    if (
+        response.direct_passthrough
+        or response.is_streamed
+        or response.status_code != 200
+        or response.mimetype != "application/json"
+        or "Content-Encoding" in response.headers
+        or not request.accept_encodings["gzip"]
+    ):
+        return response
+
+    cuerpo = response.get_data()
+    if len(cuerpo) < COMPRESION_UMBRAL:
+        return response
+
+    response.set_data(gzip.compress(cuerpo, COMPRESION_NIVEL, mtime=0))
+    response.headers["Content-Encoding"] = "gzip"
+    response.vary.add("Accept-Encoding")
+    return response
+
+# ---------- FEED DE CAMBIOS (SSE) ----------
+# Las escrituras se anotan en change_log dentro de la misma transacción; el
+# stream lo lee por id, así que también ve cambios hechos por otros procesos
+CAMBIOS_RETENCION = 10000  # filas que se conservan en change_log
+CAMBIOS_LOTE = 500
+CAMBIOS_POLL = 2  # segundos entre consultas cuando no hay avisos locales
+CAMBIOS_HEARTBEAT = 15  # segundos
+
+class CanalCambios:
+    """Wakes local SSE streams and carries ephemeral events (e.g. migration progress)."""
+
+    def __init__(self, capacidad=256):
+        self.condicion = threading.Condition()
+        self.version = 0
+        self.seq = 0
+        self.efimeros = deque(maxlen=capacidad)  # (seq, evento, datos)
+
+    def notificar(self):
+        with self.condicion:
+            self.version += 1
+            self.condicion.notify_all()
+
+    def publicar(self, evento, datos):
+        with self.condicion:
+            self.seq += 1
+            self.efimeros.append((self.seq, evento, datos))
+            self.version += 1
+            self.condicion.notify_all()
+
+    def esperar(self, version, timeout):
+        with self.condicion:
+            self.condicion.wait_for(lambda: self.version != version, timeout)
+            return self.version
+
+    def efimeros_desde(self, seq):
+        with self.condicion:
+            return [e for e in self.efimeros if e[0] > seq], self.seq
+
+canal_cambios = CanalCambios()
+
+def registrar_cambio(conn, entidad, accion, entidad_id, datos=None):
+    """Append a change to change_log; call canal_cambios.notificar() after commit."""
+    cursor = conn.execute(
+        consultas.INSERTAR_CAMBIO,
+        (entidad, accion, entidad_id, json.dumps(datos, ensure_ascii=False) if datos is not None else None)
     )
-    """)
-    
-    # Tabla de evaluaciones por materia
-    conn.execute("""
-    CREATE TABLE IF NOT EXISTS evaluations (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        subject_id INTEGER NOT NULL,
-        nombre TEXT NOT NULL,
-        nota REAL NOT NULL,
-        porcentaje INTEGER NOT NULL,
-        FOREIGN KEY (subject_id) REFERENCES subjects(id)
+
+    # Recorte ocasional para que la tabla no crezca sin límite
+    if cursor.lastrowid % CAMBIOS_LOTE == 0:
+        conn.execute(consultas.RECORTAR_CAMBIOS, (cursor.lastrowid - CAMBIOS_RETENCION,))
+    return cursor.lastrowid
+
+def formato_sse(evento, datos, id_evento=None):
+    lineas = [] if id_evento is None else [f"id: {id_evento}"]
+    lineas.append(f"event: {evento}")
+    lineas.append("data: " + json.dumps(datos, ensure_ascii=False))
+    return "\n".join(lineas) + "\n\n"
+
+def fila_estudiante(conn, student_id):
+    est = conn.execute(consultas.ESTUDIANTE_POR_ID, (student_id,)).fetchone()
+    return dict(est) if est else None
+
+# ---------- MANTENIMIENTO DE SQLITE ----------
+# Un hilo en segundo plano mantiene la base de estudiantes: estadísticas del
+# planificador tras escrituras grandes, vacuum incremental, verificación de
+# integridad y respaldos en caliente con la API de backup de sqlite3
+MANT_INTERVALO = 60  # segundos entre revisiones
+MANT_UMBRAL_ESCRITURAS = 1000  # filas modificadas que disparan ANALYZE
+MANT_OPTIMIZE_CADA = 60 * 60
+MANT_INTEGRIDAD_CADA = 24 * 60 * 60
+MANT_BACKUP_CADA = 24 * 60 * 60
+MANT_VACUUM_PAGINAS_LIBRES = 256  # páginas libres antes de compactar
+MANT_VACUUM_LOTE = 1024  # páginas liberadas por pasada
+MANT_BACKUP_PAGINAS = 256  # páginas copiadas por paso del backup
+MANT_BACKUPS_CONSERVAR = 7
+BACKUPS_DIR = os.path.join(BASE_DIR, "backups")
+
+class MantenimientoBD:
+    """Background maintenance for a SQLite database file."""
+
+    TAREAS = ("analyze", "optimize", "vacuum", "integridad", "backup")
+
+    def __init__(self, ruta, backups_dir=BACKUPS_DIR):
+        self.ruta = ruta
+        self.backups_dir = backups_dir
+        self.prefijo_backup = os.path.splitext(os.path.basename(ruta))[0] + "-"
+        self.lock = threading.Lock()  # una tarea a la vez
+        self.lock_contador = threading.Lock()
+        self.despertar = threading.Event()
+        self.escrituras_pendientes = 0
+        self.ultimas = {tarea: None for tarea in self.TAREAS}
+        self.resultados = {}
+
+        backups = self.listar_backups()
+        if backups:
+            self.ultimas["backup"] = os.path.getmtime(backups[-1])
+
+    def conectar(self):
+        return sqlite3.connect(self.ruta, timeout=30)
+
+    def registrar_escrituras(self, cantidad):
+        with self.lock_contador:
+            self.escrituras_pendientes += cantidad
+            if self.escrituras_pendientes >= MANT_UMBRAL_ESCRITURAS:
+                self.despertar.set()
+
+    def analyze(self):
+        conn = self.conectar()
+        conn.execute("ANALYZE")
+        conn.execute("PRAGMA optimize")
+        conn.close()
+        with self.lock_contador:
+            self.escrituras_pendientes = 0
+        return "ok"
+
+    def optimize(self):
+        conn = self.conectar()
+        conn.execute("PRAGMA optimize")
+        conn.close()
+        return "ok"
+
+    def vacuum(self):
+        conn = self.conectar()
+        libres = conn.execute("PRAGMA freelist_count").fetchone()[0]
+        if libres >= MANT_VACUUM_PAGINAS_LIBRES:
+            # El pragma devuelve filas; hay que consumirlas para que avance
+            conn.execute(f"PRAGMA incremental_vacuum({MANT_VACUUM_LOTE})").fetchall()
+        restantes = conn.execute("PRAGMA freelist_count").fetchone()[0]
+        conn.close()
+        return {"paginas_liberadas": libres - restantes, "paginas_libres": restantes}
+
+    def integridad(self):
+        conn = self.conectar()
+        filas = conn.execute("PRAGMA quick_check").fetchall()
+        conn.close()
+        return [fila[0] for fila in filas]
+
+    def listar_backups(self):
+        return sorted(glob.glob(os.path.join(self.backups_dir, self.prefijo_backup + "*.db")))
+
+    def backup(self):
+        os.makedirs(self.backups_dir, exist_ok=True)
+        marca = datetime.datetime.now().strftime("%Y%m%d-%H%M%S")
+        destino = os.path.join(self.backups_dir, f"{self.prefijo_backup}{marca}.db")
+        temporal = destino + ".tmp"
+
+        # Copia por pasos: entre paso y paso los demás pueden seguir escribiendo
+        origen = self.conectar()
+        copia = sqlite3.connect(temporal)
+        try:
+            origen.backup(copia, pages=MANT_BACKUP_PAGINAS, sleep=0.05)
+        finally:
+            copia.close()
+            origen.close()
+        os.replace(temporal, destino)
+
+        for viejo in self.listar_backups()[:-MANT_BACKUPS_CONSERVAR]:
+            os.remove(viejo)
+        return os.path.basename(destino)
+
+    def ejecutar(self, tarea):
+        if tarea not in self.TAREAS:
+            raise ValueError(f"Tarea de mantenimiento desconocida: {tarea}")
+        with self.lock:
+            inicio = time.time()
+            try:
+                resultado = getattr(self, tarea)()
+                error = None
+            except (sqlite3.Error, OSError) as e:
+                resultado, error = None, str(e)
+            self.ultimas[tarea] = inicio
+            self.resultados[tarea] = {
+                "resultado": resultado,
+                "error": error,
+                "duracion": round(time.time() - inicio, 3)
+            }
+            return self.resultados[tarea]
+
+    def vencida(self, tarea, cada):
+        ultima = self.ultimas[tarea]
+        return ultima is None or time.time() - ultima >= cada
+
+    def ciclo(self):
+        while True:
+            self.despertar.wait(MANT_INTERVALO)
+            self.despertar.clear()
+
+            with self.lock_contador:
+                pendientes = self.escrituras_pendientes
+            if pendientes >= MANT_UMBRAL_ESCRITURAS:
+                self.ejecutar("analyze")
+            elif self.vencida("optimize", MANT_OPTIMIZE_CADA):
+                self.ejecutar("optimize")
+
+            self.ejecutar("vacuum")
+
+            if self.vencida("integridad", MANT_INTEGRIDAD_CADA):
+                self.ejecutar("integridad")
+            if self.vencida("backup", MANT_BACKUP_CADA):
+                self.ejecutar("backup")
+
+    def iniciar(self):
+        hilo = threading.Thread(target=self.ciclo, name="mantenimiento-bd", daemon=True)
+        hilo.start()
+        return hilo
+
+    def estado(self):
+        conn = self.conectar()
+        paginas = conn.execute("PRAGMA page_count").fetchone()[0]
+        libres = conn.execute("PRAGMA freelist_count").fetchone()[0]
+        tam_pagina = conn.execute("PRAGMA page_size").fetchone()[0]
+        auto_vacuum = conn.execute("PRAGMA auto_vacuum").fetchone()[0]
+        journal = conn.execute("PRAGMA journal_mode").fetchone()[0]
+        conn.close()
+
+        wal = self.ruta + "-wal"
+        return {
+            "tamano_bd": os.path.getsize(self.ruta),
+            "tamano_wal": os.path.getsize(wal) if os.path.exists(wal) else 0,
+            "paginas": paginas,
+            "paginas_libres": libres,
+            "tamano_pagina": tam_pagina,
+            "fragmentacion": round(libres / paginas * 100, 2) if paginas else 0,
+            "auto_vacuum": {0: "none", 1: "full", 2: "incremental"}.get(auto_vacuum, auto_vacuum),
+            "journal_mode": journal,
+            "escrituras_pendientes": self.escrituras_pendientes,
+            "ultimas": {
+                tarea: datetime.datetime.fromtimestamp(ultima).strftime("%Y-%m-%d %H:%M:%S") if ultima else None
+                for tarea, ultima in self.ultimas.items()
+            },
+            "resultados": self.resultados,
+            "backups": [
+                {"archivo": os.path.basename(ruta), "tamano": os.path.getsize(ruta)}
+                for ruta in self.listar_backups()
+            ]
+        }
+
+mantenimiento = MantenimientoBD(STUDENTS_DB)
+if ES_PROCESO_PRINCIPAL:
+    mantenimiento.iniciar()
+
+# ---------- ARCHIVO DE HISTORIALES (DATOS FRÍOS) ----------
+# Los semestres cerrados (estado distinto de 'activo') se mueven por lotes a
+# base_datos_archivo.db; las consultas del dashboard solo ven los datos activos
+ARCHIVO_LOTE = 500  # semestres por transacción
+
+def archivar_semestres(lote=ARCHIVO_LOTE):
+    """Move closed semesters with their subjects and evaluations to the archive DB."""
+    conn = get_students_db()
+    conn.execute("ATTACH DATABASE ? AS archivo", (ARCHIVE_DB,))
+    conn.execute(consultas.TABLA_LOTE_ARCHIVO)
+    
+    totales = {"semestres": 0, "materias": 0, "evaluaciones": 0, "lotes": 0}
+    while True:
+        conn.execute(consultas.VACIAR_LOTE_ARCHIVO)
+        conn.execute(consultas.LLENAR_LOTE_ARCHIVO, (lote,))
+        if conn.execute(consultas.CONTAR_LOTE_ARCHIVO).fetchone()[0] == 0:
+            break
+        
+        # Una transacción sobre dos bases WAL adjuntas no es atómica entre
+        # ambos archivos: primero se confirma la copia y luego se borra de
+        # main. Si se corta en medio, el lote sigue en main y se vuelve a
+        # copiar; INSERT OR REPLACE hace que repetir la copia no duplique filas
+        evaluaciones = conn.execute(consultas.ARCHIVAR_EVALUACIONES).rowcount
+        materias = conn.execute(consultas.ARCHIVAR_MATERIAS).rowcount
+        semestres = conn.execute(consultas.ARCHIVAR_SEMESTRES).rowcount
+        conn.commit()
+        
+        conn.execute(consultas.BORRAR_EVALUACIONES_LOTE)
+        conn.execute(consultas.BORRAR_MATERIAS_LOTE)
+        conn.execute(consultas.BORRAR_SEMESTRES_LOTE)
+        conn.commit()
+        
+        totales["semestres"] += semestres
+        totales["materias"] += materias
+        totales["evaluaciones"] += evaluaciones
+        totales["lotes"] += 1
+    
+    # Un único aviso por ejecución: el dashboard cuenta solo las materias activas
+    if totales["lotes"]:
+        registrar_cambio(conn, "archivo", "insert", None, totales)
+        conn.commit()
+    conn.close()
+    if totales["lotes"]:
+        canal_cambios.notificar()
+        mantenimiento.registrar_escrituras(
+            totales["semestres"] + totales["materias"] + totales["evaluaciones"]
+        )
+    return totales
+
+# ---------- RESUMEN ACADÉMICO ----------
+# Promedio general, promedios por semestre y materias aprobadas/reprobadas por
+# estudiante. Cada escritura de notas ajusta las sumas de su estudiante en la
+# misma transacción, así el ranking y la lista de riesgo no recorren subjects
+NOTA_APROBATORIA = 10
+
+def sumar_notas_resumen(conn, student_id, semestres):
+    """Add newly inserted final grades to a student's summary.
+
+    semestres is a list of (semester_id, semestre, año, notas).
+    """
+    filas = []
+    for semester_id, semestre, anio, notas in semestres:
+        notas = [nota for nota in notas if nota is not None]
+        aprobadas = sum(1 for nota in notas if nota >= NOTA_APROBATORIA)
+        filas.append((semester_id, student_id, semestre, anio, sum(notas), len(notas), aprobadas))
+    if not filas:
+        return
+    
+    conn.executemany(consultas.SUMAR_RESUMEN_SEMESTRE, filas)
+    
+    suma = sum(fila[4] for fila in filas)
+    materias = sum(fila[5] for fila in filas)
+    aprobadas = sum(fila[6] for fila in filas)
+    conn.execute(
+        consultas.SUMAR_RESUMEN_ESTUDIANTE,
+        (student_id, suma, materias, aprobadas, suma / materias if materias else None)
     )
-    """)
-    
-    conn.commit()
+
+def eliminar_resumen(conn, student_id):
+    conn.execute(consultas.ELIMINAR_RESUMEN_SEMESTRES, (student_id,))
+    conn.execute(consultas.ELIMINAR_RESUMEN_ESTUDIANTE, (student_id,))
+
+def reconstruir_resumen(conn):
+    """Recompute every summary row from active and archived grades.
+
+    conn must come from get_students_db_historico().
+    """
+    conn.execute(consultas.VACIAR_RESUMEN_SEMESTRES)
+    conn.execute(consultas.VACIAR_RESUMEN_ESTUDIANTES)
+    conn.execute(consultas.RECONSTRUIR_RESUMEN_SEMESTRES, (NOTA_APROBATORIA,))
+    conn.execute(consultas.RECONSTRUIR_RESUMEN_ESTUDIANTES)
+    return conn.execute(consultas.CONTAR_RESUMEN).fetchone()[0]
+
+def init_resumen():
+    # Bases creadas antes del resumen: se calcula una vez al arrancar
+    conn = get_students_db_historico()
+    if conn.execute(consultas.RESUMEN_VACIO).fetchone() is None:
+        reconstruir_resumen(conn)
+        conn.commit()
     conn.close()
 
-init_db()
-init_students_db()
+def filas_resumen(conn, filas):
+    """Summary rows as dicts, with their per-semester averages."""
+    ids = json.dumps([fila["student_id"] for fila in filas])
+    semestres = {}
+    for sem in conn.execute(consultas.SEMESTRES_RESUMEN, (ids,)):
+        semestres.setdefault(sem["student_id"], []).append({
+            "semestre": sem["semestre"],
+            "año": sem["año"],
+            "promedio": round(sem["promedio"], 2) if sem["promedio"] is not None else None,
+            "materias": sem["materias"]
+        })
+    
+    return [
+        {
+            "id": fila["student_id"],
+            "nombre": fila["nombre"],
+            "apellido": fila["apellido"],
+            "carrera": fila["carrera"],
+            "promedio": round(fila["promedio"], 2),
+            "materias": fila["materias"],
+            "aprobadas": fila["aprobadas"],
+            "reprobadas": fila["materias"] - fila["aprobadas"],
+            "ultima_actividad": fila["ultima_actividad"],
+            "semestres": semestres.get(fila["student_id"], [])
+        }
+        for fila in filas
+    ]
+
+if ES_PROCESO_PRINCIPAL:
+    init_resumen()
+
+# ---------- ANALÍTICA COLUMNAR ----------
+# Un hilo guarda periódicamente una instantánea columnar de las tablas de
+# estudiantes (analitica.py); el dashboard y las tendencias por año agregan
+# sobre ella en lugar de recorrer subjects. Sin numpy todo sale de SQLite
+INSTANTANEAS_DIR = os.path.join(BASE_DIR, "instantaneas")
+ANALITICA_INTERVALO = 10 * 60  # segundos entre instantáneas
+ANALITICA_EDAD_MAXIMA = 60 * 60  # más vieja que esto, el dashboard vuelve a SQL
+# Tras un cambio el dashboard lee de SQL hasta la próxima instantánea, que se
+# adelanta; esperar este tiempo agrupa las ráfagas de cambios en una sola
+ANALITICA_ESPERA_CAMBIOS = 60  # segundos
+
+class AnaliticaColumnar:
+    """Keeps the columnar snapshot fresh and hands out the current one."""
+
+    def __init__(self, directorio=INSTANTANEAS_DIR):
+        self.directorio = directorio
+        self.lock = threading.Lock()  # una instantánea a la vez
+        self.instantanea = None
+        self.marca = None  # mtime del puntero de la instantánea cargada
+        self.ultima = None  # resultado de la última renovación de este proceso
+        self.despertar = threading.Event()  # hay cambios que la instantánea no tiene
+
+    def registrar_resultado(self, inicio, error=None, meta=None):
+        self.ultima = {
+            "fecha": datetime.datetime.fromtimestamp(inicio).strftime("%Y-%m-%d %H:%M:%S"),
+            "error": error,
+            "duracion": round(time.time() - inicio, 3),
+            "filas": meta["filas"] if meta else None
+        }
+        return self.ultima
+
+    def renovar(self):
+        with self.lock:
+            inicio = time.time()
+            try:
+                conn = get_students_db_historico()
+                try:
+                    meta = analitica.crear_instantanea(conn, self.directorio)
+                finally:
+                    conn.close()
+            except Exception as e:
+                return self.registrar_resultado(inicio, error=str(e))
+            return self.registrar_resultado(inicio, meta=meta)
+
+    def actual(self):
+        """Current snapshot, reloaded when this or another process replaced it."""
+        try:
+            marca = os.stat(os.path.join(self.directorio, analitica.PUNTERO)).st_mtime_ns
+        except OSError:
+            return None
+        if marca != self.marca:
+            self.instantanea = analitica.cargar_instantanea(self.directorio)
+            self.marca = marca if self.instantanea else None
+        return self.instantanea
+
+    def vigente(self):
+        """Current snapshot unless it is older than ANALITICA_EDAD_MAXIMA."""
+        instantanea = self.actual()
+        if instantanea and instantanea.edad() <= ANALITICA_EDAD_MAXIMA:
+            return instantanea
+        return None
+
+    def desactualizada(self, instantanea):
+        conn = get_students_db()
+        ultimo = conn.execute(consultas.ULTIMO_CAMBIO).fetchone()[0]
+        conn.close()
+        return ultimo > instantanea.ultimo_cambio()
+
+    def al_dia(self):
+        """Current snapshot if it is recent and has every recorded change, else None.
+
+        Being behind change_log wakes the background thread to renew it early.
+        """
+        instantanea = self.vigente()
+        if instantanea and self.desactualizada(instantanea):
+            self.despertar.set()
+            return None
+        return instantanea
+
+    def turno(self):
+        """Renew the snapshot if it is due; returns the seconds until the next check."""
+        # Se mide la edad de la instantánea y no un temporizador propio: si
+        # otro proceso ya la renovó, este no repite el trabajo
+        instantanea = self.actual()
+        if instantanea:
+            self.despertar.clear()
+            espera = ANALITICA_INTERVALO - instantanea.edad()
+            if espera > 0 and not self.desactualizada(instantanea):
+                return espera
+        self.renovar()
+        return ANALITICA_INTERVALO
+
+    def ciclo(self):
+        while True:
+            inicio = time.time()
+            try:
+                espera = self.turno()
+            except Exception as e:
+                # Un error no debe terminar el hilo: queda en el estado y se reintenta
+                self.registrar_resultado(inicio, error=str(e))
+                espera = ANALITICA_INTERVALO
+            if self.despertar.wait(espera):
+                time.sleep(ANALITICA_ESPERA_CAMBIOS)
+
+    def iniciar(self):
+        hilo = threading.Thread(target=self.ciclo, name="analitica", daemon=True)
+        hilo.start()
+        return hilo
+
+    def estado(self):
+        instantanea = self.actual()
+        return {
+            "instantanea": instantanea.info() if instantanea else None,
+            "intervalo": ANALITICA_INTERVALO,
+            "edad_maxima": ANALITICA_EDAD_MAXIMA,
+            "ultima_renovacion": self.ultima
+        }
+
+analitica_columnar = AnaliticaColumnar() if analitica else None
+if analitica_columnar and ES_PROCESO_PRINCIPAL:
+    analitica_columnar.iniciar()
 
 # ---------- RUTAS ----------
 @app.route("/")
+@app.route("/index.html")
+@login_requerido
 def home():
-    if "user_id" not in session:
-        return redirect("/login.html")
-    return render_template("index.html")
+    return servir_pagina("index.html")
 
 @app.route("/login.html")
 def login_page():
-    return render_template("login.html")
+    return servir_pagina("login.html")
+
+@app.route("/configuracion.html")
+@login_requerido
+def configuracion():
+    return servir_pagina("configuracion.html")
 
 # ---------- LOGIN ----------
 @app.route("/login", methods=["POST"])
@@ -137,24 +1189,72 @@ def login():
     email = request.form["email"]
     password = request.form["password"]
 
-    conn = get_db()
-    user = conn.execute(
-        "SELECT * FROM users WHERE email = ?", (email,)
-    ).fetchone()
-    conn.close()
+    # Rechazar clientes que insisten antes de calcular ningún hash
+    claves = claves_intento(email)
+    if esta_bloqueado(claves):
+        return pagina_login_con_mensaje(
+            "Demasiados intentos fallidos. Espere unos minutos antes de volver a intentarlo.",
+            429, VENTANA_INTENTOS
+        )
+
+    user = buscar_usuario(email)
+    valido = verificar_password(user[1], password) if user else False
 
-    if user and check_password_hash(user["password_hash"], password):
-        session["user_id"] = user["id"]
+    # Un pool saturado no es culpa del usuario: no cuenta como intento fallido
+    if valido is None:
+        return pagina_login_con_mensaje(
+            "El servidor está ocupado. Intente iniciar sesión de nuevo en unos segundos.",
+            503, HASH_TIMEOUT
+        )
+
+    if valido:
+        limpiar_intentos(claves)
+        regenerar_sesion()
+        session["user_id"] = user[0]
         return redirect("/")
 
+    registrar_intento_fallido(claves)
     return redirect("/login.html")
 
+# ---------- CAMBIO DE CONTRASEÑA ----------
+@app.route("/api/usuario/password", methods=["POST"])
+@login_requerido
+def cambiar_password():
+    data = request.get_json()
+    actual = data.get("actual")
+    nuevo = data.get("nuevo")
+
+    if not actual or not nuevo:
+        return {"error": "Faltan campos requeridos"}, 400
+
+    conn = get_db()
+    user = conn.execute(consultas.USUARIO_POR_ID, (session["user_id"],)).fetchone()
+
+    if not user:
+        conn.close()
+        return {"error": "Usuario no encontrado"}, 404
+
+    valido = verificar_password(user["password_hash"], actual)
+    if valido is None:
+        conn.close()
+        return {"error": "El servidor está ocupado, intente de nuevo"}, 503
+    if not valido:
+        conn.close()
+        return {"error": "La contraseña actual es incorrecta"}, 400
+
+    nuevo_hash = hash_pool.submit(generate_password_hash, nuevo).result()
+    conn.execute(consultas.ACTUALIZAR_PASSWORD, (nuevo_hash, session["user_id"]))
+    conn.commit()
+    conn.close()
+
+    invalidar_usuario_cache(user["email"])
+
+    return {"success": True, "message": "Contraseña actualizada correctamente"}
+
 # ---------- REGISTRO DE ESTUDIANTES (MODIFICACIÓN PERTINENTE) ----------
 @app.route("/estudiantes/registrar", methods=["POST"])
+@login_requerido
 def registrar_estudiante():
-    if "user_id" not in session:
-        return redirect("/login.html")
-
     nombre = request.form["nombre"]
     apellido = request.form["apellido"]
     fecha_nacimiento = request.form["fecha_nacimiento"]
@@ -164,43 +1264,31 @@ def registrar_estudiante():
     semestre = request.form["semestre"]
 
     conn = get_students_db()
-    conn.execute("""
-        INSERT INTO estudiantes (
-            nombre, apellido, fecha_nacimiento,
-            telefono, correo, carrera, semestre
-        ) VALUES (?, ?, ?, ?, ?, ?, ?)
-    """, (
+    cursor = conn.execute(consultas.INSERTAR_ESTUDIANTE, (
         nombre, apellido, fecha_nacimiento,
         telefono, correo, carrera, semestre
     ))
+    registrar_cambio(conn, "estudiantes", "insert", cursor.lastrowid,
+                     fila_estudiante(conn, cursor.lastrowid))
     conn.commit()
     conn.close()
+    canal_cambios.notificar()
 
     return redirect("/base_de_datos.html")
 
 # ---------- API PARA OBTENER ESTUDIANTES ----------
 @app.route("/api/estudiantes", methods=["GET"])
+@login_requerido
 def obtener_estudiantes():
-    if "user_id" not in session:
-        return {"error": "No autorizado"}, 401
-
     # Obtener parámetros de query
     limit = request.args.get('limit', type=int)
     recent = request.args.get('recent', 'false').lower() == 'true'
 
     conn = get_students_db()
     
-    query = """
-        SELECT id, nombre, apellido, fecha_nacimiento, 
-               telefono, correo, carrera, semestre, created_at
-        FROM estudiantes
-        ORDER BY created_at DESC
-    """
-    
-    if limit and limit > 0:
-        query += f" LIMIT {limit}"
-    
-    estudiantes = conn.execute(query).fetchall()
+    estudiantes = conn.execute(
+        consultas.LISTA_ESTUDIANTES, (limit if limit and limit > 0 else -1,)
+    ).fetchall()
     conn.close()
 
     # Convertir a lista de diccionarios
@@ -222,38 +1310,25 @@ def obtener_estudiantes():
 
 # ---------- RUTA PARA BASE DE DATOS ----------
 @app.route("/base_de_datos.html")
+@login_requerido
 def base_de_datos():
-    if "user_id" not in session:
-        return redirect("/login.html")
-    return render_template("base_de_datos.html")
+    return servir_pagina("base_de_datos.html")
 
 # ---------- API PARA OBTENER DETALLES DE ESTUDIANTE ----------
 @app.route("/api/estudiantes/<int:student_id>/detalle", methods=["GET"])
+@login_requerido
 def obtener_detalle_estudiante(student_id):
-    if "user_id" not in session:
-        return {"error": "No autorizado"}, 401
-
-    conn = get_students_db()
+    conn = get_students_db_historico()
     
     # Obtener información básica del estudiante
-    estudiante = conn.execute("""
-        SELECT id, nombre, apellido, fecha_nacimiento, 
-               telefono, correo, carrera
-        FROM estudiantes
-        WHERE id = ?
-    """, (student_id,)).fetchone()
+    estudiante = conn.execute(consultas.ESTUDIANTE_POR_ID, (student_id,)).fetchone()
     
     if not estudiante:
         conn.close()
         return {"error": "Estudiante no encontrado"}, 404
     
-    # Obtener semestres del estudiante
-    semestres = conn.execute("""
-        SELECT id, semestre, año, estado
-        FROM semesters
-        WHERE student_id = ?
-        ORDER BY año DESC, semestre DESC
-    """, (student_id,)).fetchall()
+    # Obtener semestres del estudiante (activos y archivados)
+    semestres = conn.execute(consultas.SEMESTRES_HISTORICO_ESTUDIANTE, (student_id,)).fetchall()
     
     resultado = {
         "estudiante": {
@@ -270,19 +1345,11 @@ def obtener_detalle_estudiante(student_id):
     
     # Para cada semestre, obtener materias y evaluaciones
     for semestre in semestres:
-        materias = conn.execute("""
-            SELECT id, nombre, nota_final
-            FROM subjects
-            WHERE semester_id = ?
-        """, (semestre["id"],)).fetchall()
+        materias = conn.execute(consultas.MATERIAS_HISTORICO_SEMESTRE, (semestre["id"],)).fetchall()
         
         materias_list = []
         for materia in materias:
-            evaluaciones = conn.execute("""
-                SELECT nombre, nota, porcentaje
-                FROM evaluations
-                WHERE subject_id = ?
-            """, (materia["id"],)).fetchall()
+            evaluaciones = conn.execute(consultas.EVALUACIONES_HISTORICO_MATERIA, (materia["id"],)).fetchall()
             
             evaluaciones_list = [
                 {
@@ -303,6 +1370,7 @@ def obtener_detalle_estudiante(student_id):
             "semestre": semestre["semestre"],
             "año": semestre["año"],
             "estado": semestre["estado"],
+            "archivado": bool(semestre["archivado"]),
             "materias": materias_list
         })
     
@@ -311,30 +1379,21 @@ def obtener_detalle_estudiante(student_id):
 
 # ---------- API PARA ACTUALIZAR ESTUDIANTE ----------
 @app.route("/api/estudiantes/<int:student_id>", methods=["PUT"])
+@login_requerido
 def actualizar_estudiante(student_id):
-    if "user_id" not in session:
-        return {"error": "No autorizado"}, 401
-
     data = request.get_json()
     
     conn = get_students_db()
     
     # Verificar que el estudiante existe
-    estudiante = conn.execute(
-        "SELECT id FROM estudiantes WHERE id = ?", (student_id,)
-    ).fetchone()
+    estudiante = conn.execute(consultas.ESTUDIANTE_EXISTE, (student_id,)).fetchone()
     
     if not estudiante:
         conn.close()
         return {"error": "Estudiante no encontrado"}, 404
     
     # Actualizar información del estudiante
-    conn.execute("""
-        UPDATE estudiantes 
-        SET nombre = ?, apellido = ?, fecha_nacimiento = ?,
-            telefono = ?, correo = ?, carrera = ?, semestre = ?
-        WHERE id = ?
-    """, (
+    conn.execute(consultas.ACTUALIZAR_ESTUDIANTE, (
         data.get("nombre"),
         data.get("apellido"),
         data.get("fecha_nacimiento"),
@@ -345,27 +1404,161 @@ def actualizar_estudiante(student_id):
         student_id
     ))
     
+    actualizado = fila_estudiante(conn, student_id)
+    registrar_cambio(conn, "estudiantes", "update", student_id, actualizado)
     conn.commit()
     conn.close()
+    canal_cambios.notificar()
     
-    return {"success": True, "message": "Estudiante actualizado correctamente"}
+    return {"success": True, "message": "Estudiante actualizado correctamente", "estudiante": actualizado}
+
+# ---------- API PARA ACTUALIZACIÓN PARCIAL DE ESTUDIANTES ----------
+# PATCH cambia solo los campos enviados. La variante en bloque aplica los mismos
+# cambios a una lista de ids o a un filtro de carrera/semestre en una sola
+# sentencia y una sola transacción
+CAMPOS_ESTUDIANTE = ("nombre", "apellido", "fecha_nacimiento", "telefono", "correo", "carrera", "semestre")
+# El correo identifica al estudiante en las migraciones: no se cambia en bloque
+CAMPOS_EN_BLOQUE = tuple(campo for campo in CAMPOS_ESTUDIANTE if campo != "correo")
+FILTROS_EN_BLOQUE = ("carrera", "semestre")
+# Estudiantes por actualización en bloque, por ids o por filtro
+ACTUALIZACION_MAX_ESTUDIANTES = 10000
+
+def normalizar_valor(campo, valor):
+    """Validate one student field; returns (valor, None) or (None, error message)."""
+    if campo == "semestre":
+        try:
+            valor = int(valor) if not isinstance(valor, bool) else 0
+        except (TypeError, ValueError, OverflowError):
+            valor = 0
+        if valor < 1:
+            return None, "El semestre debe ser un entero positivo"
+        return valor, None
+    
+    # Un teléfono o una cédula pueden llegar como número en el JSON
+    if isinstance(valor, (int, float)) and not isinstance(valor, bool) and math.isfinite(valor):
+        valor = str(int(valor)) if float(valor).is_integer() else str(valor)
+    elif valor is not None and not isinstance(valor, str):
+        return None, f"Tipo no válido para {campo}: se esperaba texto"
+    valor = (valor or "").strip()
+    if not valor:
+        return None, f"{CAMPO_VACIO}: {campo}"
+    return valor, None
+
+def normalizar_cambios(cambios, permitidos):
+    """Validate a PATCH field set; returns (cambios, None) or (None, error message)."""
+    if not isinstance(cambios, dict) or not cambios:
+        return None, "No hay campos para actualizar"
+    desconocidos = sorted(set(cambios) - set(permitidos))
+    if desconocidos:
+        return None, f"Campos no permitidos: {', '.join(desconocidos)}"
+    
+    normalizados = {}
+    for campo, valor in cambios.items():
+        valor, error = normalizar_valor(campo, valor)
+        if error:
+            return None, error
+        normalizados[campo] = valor
+    return normalizados, None
+
+@app.route("/api/estudiantes/<int:student_id>", methods=["PATCH"])
+@login_requerido
+def actualizar_campos_estudiante(student_id):
+    cambios, error = normalizar_cambios(request.get_json(silent=True), CAMPOS_ESTUDIANTE)
+    if error:
+        return {"error": error}, 400
+    
+    conn = get_students_db()
+    # Sin fila devuelta por RETURNING, el estudiante no existe
+    filas = conn.execute(consultas.ACTUALIZAR_CAMPOS_ESTUDIANTE, {
+        "cambios": json.dumps(cambios, ensure_ascii=False),
+        "id": student_id
+    }).fetchall()
+    
+    if not filas:
+        conn.close()
+        return {"error": "Estudiante no encontrado"}, 404
+    
+    actualizado = dict(filas[0])
+    registrar_cambio(conn, "estudiantes", "update", student_id, actualizado)
+    conn.commit()
+    conn.close()
+    canal_cambios.notificar()
+    
+    return {"success": True, "message": "Estudiante actualizado correctamente", "estudiante": actualizado}
+
+@app.route("/api/estudiantes", methods=["PATCH"])
+@login_requerido
+def actualizar_estudiantes_en_bloque():
+    # {"cambios": {...}, "ids": [...]} o {"cambios": {...}, "filtro": {"carrera": ..., "semestre": ...}}
+    data = request.get_json(silent=True) or {}
+    cambios, error = normalizar_cambios(data.get("cambios"), CAMPOS_EN_BLOQUE)
+    if error:
+        return {"error": error}, 400
+    
+    ids = data.get("ids")
+    filtro = data.get("filtro")
+    if (ids is None) == (filtro is None):
+        return {"error": "Indique ids o filtro (uno de los dos)"}, 400
+    
+    params = {"cambios": json.dumps(cambios, ensure_ascii=False)}
+    if ids is not None:
+        if not isinstance(ids, list) or not ids or not all(type(i) is int for i in ids):
+            return {"error": "ids debe ser una lista de enteros"}, 400
+        if len(ids) > ACTUALIZACION_MAX_ESTUDIANTES:
+            return {"error": f"Máximo {ACTUALIZACION_MAX_ESTUDIANTES} ids por solicitud"}, 400
+        consulta = consultas.ACTUALIZAR_CAMPOS_ESTUDIANTES
+        params["ids"] = json.dumps(ids)
+    else:
+        if not isinstance(filtro, dict) or not filtro or set(filtro) - set(FILTROS_EN_BLOQUE):
+            return {"error": "El filtro admite carrera y/o semestre"}, 400
+        for campo, valor in filtro.items():
+            valor, error = normalizar_valor(campo, valor)
+            if error:
+                return {"error": f"Filtro no válido: {error}"}, 400
+            params[campo] = valor
+        consulta = consultas.ACTUALIZAR_CAMPOS_POR_FILTRO[("carrera" in filtro, "semestre" in filtro)]
+    
+    conn = get_students_db()
+    actualizados = [dict(fila) for fila in conn.execute(consulta, params).fetchall()]
+    # Un filtro no tiene tamaño conocido de antemano: si abarca demasiados se deshace
+    if len(actualizados) > ACTUALIZACION_MAX_ESTUDIANTES:
+        conn.rollback()
+        conn.close()
+        return {
+            "error": f"El filtro abarca {len(actualizados)} estudiantes; el máximo por solicitud es "
+                     f"{ACTUALIZACION_MAX_ESTUDIANTES}"
+        }, 400
+    
+    # Un solo aviso para todo el bloque: las listas abiertas se recargan una vez
+    # en lugar de repintarse por cada estudiante
+    if actualizados:
+        registrar_cambio(conn, "estudiantes_bloque", "update", None, {
+            "cambios": cambios,
+            "actualizados": len(actualizados)
+        })
+    conn.commit()
+    conn.close()
+    
+    if actualizados:
+        mantenimiento.registrar_escrituras(len(actualizados))
+        canal_cambios.notificar()
+    
+    resultado = {"success": True, "actualizados": len(actualizados)}
+    if ids is not None:
+        encontrados = {estudiante["id"] for estudiante in actualizados}
+        resultado["no_encontrados"] = [i for i in ids if i not in encontrados]
+    else:
+        resultado["ids"] = [estudiante["id"] for estudiante in actualizados]
+    return resultado
 
 # ---------- API PARA OBTENER MATERIAS DE UN ESTUDIANTE ----------
 @app.route("/api/estudiantes/<int:student_id>/materias", methods=["GET"])
+@login_requerido
 def obtener_materias_estudiante(student_id):
-    if "user_id" not in session:
-        return {"error": "No autorizado"}, 401
-    
     conn = get_students_db()
     
     # Obtener todas las materias del estudiante con su semestre
-    materias = conn.execute("""
-        SELECT s.id as subject_id, s.nombre as materia, sem.semestre, sem.año
-        FROM subjects s
-        JOIN semesters sem ON s.semester_id = sem.id
-        WHERE sem.student_id = ?
-        ORDER BY sem.año DESC, sem.semestre DESC, s.nombre
-    """, (student_id,)).fetchall()
+    materias = conn.execute(consultas.MATERIAS_ESTUDIANTE, (student_id,)).fetchall()
     
     conn.close()
     
@@ -383,10 +1576,8 @@ def obtener_materias_estudiante(student_id):
 
 # ---------- API PARA AGREGAR EVALUACIÓN ----------
 @app.route("/api/evaluaciones", methods=["POST"])
+@login_requerido
 def agregar_evaluacion():
-    if "user_id" not in session:
-        return {"error": "No autorizado"}, 401
-    
     data = request.get_json()
     
     subject_id = data.get("subject_id")
@@ -400,151 +1591,117 @@ def agregar_evaluacion():
     conn = get_students_db()
     
     # Verificar que la materia existe
-    materia = conn.execute(
-        "SELECT id FROM subjects WHERE id = ?", (subject_id,)
-    ).fetchone()
+    materia = conn.execute(consultas.MATERIA_EXISTE, (subject_id,)).fetchone()
     
     if not materia:
         conn.close()
         return {"error": "Materia no encontrada"}, 404
     
     # Insertar la nueva evaluación
-    conn.execute("""
-        INSERT INTO evaluations (subject_id, nombre, nota, porcentaje)
-        VALUES (?, ?, ?, ?)
-    """, (subject_id, nombre, nota, porcentaje))
+    cursor = conn.execute(consultas.INSERTAR_EVALUACION, (subject_id, nombre, nota, porcentaje))
+    
+    # La nota final no cambia, pero sí la última actividad del estudiante
+    conn.execute(consultas.ACTIVIDAD_POR_MATERIA, (subject_id,))
     
+    registrar_cambio(conn, "evaluaciones", "insert", cursor.lastrowid, {
+        "subject_id": subject_id,
+        "nombre": nombre,
+        "nota": nota,
+        "porcentaje": porcentaje
+    })
     conn.commit()
     conn.close()
+    canal_cambios.notificar()
     
     return {"success": True, "message": "Evaluación agregada correctamente"}
 
 # ---------- API PARA ELIMINAR ESTUDIANTE ----------
 @app.route("/api/estudiantes/<int:student_id>", methods=["DELETE"])
+@login_requerido
 def eliminar_estudiante(student_id):
-    if "user_id" not in session:
-        return {"error": "No autorizado"}, 401
-    
-    conn = get_students_db()
+    conn = get_students_db_historico()
     
     # Verificar que el estudiante existe
-    estudiante = conn.execute(
-        "SELECT id FROM estudiantes WHERE id = ?", (student_id,)
-    ).fetchone()
+    estudiante = conn.execute(consultas.ESTUDIANTE_EXISTE, (student_id,)).fetchone()
     
     if not estudiante:
         conn.close()
         return {"error": "Estudiante no encontrado"}, 404
     
     # Obtener todos los semestres del estudiante
-    semestres = conn.execute(
-        "SELECT id FROM semesters WHERE student_id = ?", (student_id,)
-    ).fetchall()
+    semestres = conn.execute(consultas.SEMESTRES_ESTUDIANTE, (student_id,)).fetchall()
     
     # Para cada semestre, eliminar materias y sus evaluaciones
     for semestre in semestres:
-        materias = conn.execute(
-            "SELECT id FROM subjects WHERE semester_id = ?", (semestre["id"],)
-        ).fetchall()
+        materias = conn.execute(consultas.MATERIAS_SEMESTRE, (semestre["id"],)).fetchall()
         
         for materia in materias:
             # Eliminar evaluaciones de la materia
-            conn.execute("DELETE FROM evaluations WHERE subject_id = ?", (materia["id"],))
+            conn.execute(consultas.ELIMINAR_EVALUACIONES_MATERIA, (materia["id"],))
         
         # Eliminar materias del semestre
-        conn.execute("DELETE FROM subjects WHERE semester_id = ?", (semestre["id"],))
+        conn.execute(consultas.ELIMINAR_MATERIAS_SEMESTRE, (semestre["id"],))
     
     # Eliminar semestres del estudiante
-    conn.execute("DELETE FROM semesters WHERE student_id = ?", (student_id,))
+    conn.execute(consultas.ELIMINAR_SEMESTRES_ESTUDIANTE, (student_id,))
+    
+    # Eliminar también su historial archivado
+    conn.execute(consultas.ELIMINAR_EVALUACIONES_ARCHIVADAS, (student_id,))
+    conn.execute(consultas.ELIMINAR_MATERIAS_ARCHIVADAS, (student_id,))
+    conn.execute(consultas.ELIMINAR_SEMESTRES_ARCHIVADOS, (student_id,))
+    
+    eliminar_resumen(conn, student_id)
     
     # Finalmente eliminar el estudiante
-    conn.execute("DELETE FROM estudiantes WHERE id = ?", (student_id,))
+    conn.execute(consultas.ELIMINAR_ESTUDIANTE, (student_id,))
     
+    registrar_cambio(conn, "estudiantes", "delete", student_id)
     conn.commit()
+    mantenimiento.registrar_escrituras(conn.total_changes)
     conn.close()
+    canal_cambios.notificar()
     
     return {"success": True, "message": "Estudiante eliminado correctamente"}
 
 # ---------- API PARA ESTADÍSTICAS DEL DASHBOARD ----------
 @app.route("/api/estadisticas", methods=["GET"])
+@login_requerido
 def obtener_estadisticas():
-    if "user_id" not in session:
-        return {"error": "No autorizado"}, 401
-
+    # ?fuente=sql fuerza la lectura en vivo aunque haya instantánea
+    instantanea = None
+    if analitica_columnar and request.args.get("fuente") != "sql":
+        instantanea = analitica_columnar.al_dia()
+    if instantanea:
+        return {**instantanea.estadisticas(), "instantanea": instantanea.info()}
+    
     conn = get_students_db()
     
     # 1. Total de estudiantes
-    total_estudiantes = conn.execute(
-        "SELECT COUNT(*) as total FROM estudiantes"
-    ).fetchone()["total"]
+    total_estudiantes = conn.execute(consultas.TOTAL_ESTUDIANTES).fetchone()["total"]
     
     # 2. Estudiantes por carrera
-    estudiantes_por_carrera = conn.execute("""
-        SELECT carrera, COUNT(*) as cantidad 
-        FROM estudiantes 
-        GROUP BY carrera 
-        ORDER BY cantidad DESC
-    """).fetchall()
+    estudiantes_por_carrera = conn.execute(consultas.ESTUDIANTES_POR_CARRERA).fetchall()
     
     # 3. Estudiantes por semestre
-    estudiantes_por_semestre = conn.execute("""
-        SELECT semestre, COUNT(*) as cantidad 
-        FROM estudiantes 
-        GROUP BY semestre 
-        ORDER BY semestre
-    """).fetchall()
+    estudiantes_por_semestre = conn.execute(consultas.ESTUDIANTES_POR_SEMESTRE).fetchall()
     
     # 4. Promedio general por carrera
-    promedio_por_carrera = conn.execute("""
-        SELECT e.carrera, AVG(s.nota_final) as promedio
-        FROM estudiantes e
-        LEFT JOIN semesters sem ON e.id = sem.student_id
-        LEFT JOIN subjects s ON sem.id = s.semester_id
-        WHERE s.nota_final IS NOT NULL
-        GROUP BY e.carrera
-    """).fetchall()
+    promedio_por_carrera = conn.execute(consultas.PROMEDIO_POR_CARRERA).fetchall()
     
     # 5. Materias con promedios más bajos (más difíciles)
-    materias_dificiles = conn.execute("""
-        SELECT s.nombre, AVG(s.nota_final) as promedio, COUNT(*) as estudiantes
-        FROM subjects s
-        WHERE s.nota_final IS NOT NULL
-        GROUP BY s.nombre
-        HAVING COUNT(*) >= 1
-        ORDER BY promedio ASC
-        LIMIT 5
-    """).fetchall()
+    materias_dificiles = conn.execute(consultas.MATERIAS_DIFICILES).fetchall()
     
     # 6. Distribución de notas (rangos)
-    distribucion_notas = conn.execute("""
-        SELECT 
-            CASE 
-                WHEN nota_final >= 18 THEN 'Excelente (18-20)'
-                WHEN nota_final >= 15 THEN 'Bueno (15-17)'
-                WHEN nota_final >= 10 THEN 'Aprobado (10-14)'
-                ELSE 'Reprobado (0-9)'
-            END as rango,
-            COUNT(*) as cantidad
-        FROM subjects
-        WHERE nota_final IS NOT NULL
-        GROUP BY rango
-        ORDER BY nota_final DESC
-    """).fetchall()
+    distribucion_notas = conn.execute(consultas.DISTRIBUCION_NOTAS).fetchall()
     
     # 7. Total de materias registradas
-    total_materias = conn.execute(
-        "SELECT COUNT(*) as total FROM subjects"
-    ).fetchone()["total"]
+    total_materias = conn.execute(consultas.TOTAL_MATERIAS).fetchone()["total"]
     
     # 8. Total de evaluaciones
-    total_evaluaciones = conn.execute(
-        "SELECT COUNT(*) as total FROM evaluations"
-    ).fetchone()["total"]
+    total_evaluaciones = conn.execute(consultas.TOTAL_EVALUACIONES).fetchone()["total"]
     
     # 9. Promedio general del sistema
-    promedio_general = conn.execute(
-        "SELECT AVG(nota_final) as promedio FROM subjects WHERE nota_final IS NOT NULL"
-    ).fetchone()["promedio"]
+    promedio_general = conn.execute(consultas.PROMEDIO_GENERAL).fetchone()["promedio"]
     
     conn.close()
     
@@ -572,22 +1729,113 @@ def obtener_estadisticas():
         "distribucion_notas": [
             {"rango": row["rango"], "cantidad": row["cantidad"]}
             for row in distribucion_notas
-        ]
+        ],
+        "instantanea": None
+    }
+
+# ---------- API PARA TENDENCIAS ACADÉMICAS ----------
+# Promedio de notas finales por año, por materia o por carrera, sobre
+# semestres activos y archivados. Solo con la instantánea columnar
+@app.route("/api/analitica/tendencias/<any(materia, carrera):por>", methods=["GET"])
+@login_requerido
+def tendencias_academicas(por):
+    instantanea = analitica_columnar.vigente() if analitica_columnar else None
+    if not instantanea:
+        return {"error": "Analítica columnar no disponible"}, 503
+    
+    return {
+        "por": por,
+        "tendencias": instantanea.tendencias(
+            por, NOTA_APROBATORIA,
+            materia=request.args.get("materia"),
+            carrera=request.args.get("carrera")
+        ),
+        "instantanea": instantanea.info()
+    }
+
+# ---------- API PARA RANKING Y ESTUDIANTES EN RIESGO ----------
+# Ambas leen el resumen materializado recorriendo el índice de promedio
+RANKING_LIMITE = 10
+RIESGO_LIMITE = 50
+RESUMEN_LIMITE_MAX = 500
+
+@app.route("/api/estudiantes/ranking", methods=["GET"])
+@login_requerido
+def ranking_estudiantes():
+    limite = entero_param("limite", RANKING_LIMITE, RESUMEN_LIMITE_MAX)
+    
+    conn = get_students_db()
+    filas = conn.execute(consultas.RANKING, (limite,)).fetchall()
+    ranking = filas_resumen(conn, filas)
+    conn.close()
+    
+    for posicion, estudiante in enumerate(ranking, 1):
+        estudiante["posicion"] = posicion
+    return {"ranking": ranking}
+
+@app.route("/api/estudiantes/riesgo", methods=["GET"])
+@login_requerido
+def estudiantes_en_riesgo():
+    # Promedio general por debajo de la nota aprobatoria, del más bajo al más alto
+    limite = entero_param("limite", RIESGO_LIMITE, RESUMEN_LIMITE_MAX)
+    desplazamiento = entero_param("desplazamiento", 0, minimo=0)
+    
+    conn = get_students_db()
+    total = conn.execute(consultas.CONTAR_EN_RIESGO, (NOTA_APROBATORIA,)).fetchone()[0]
+    filas = conn.execute(consultas.EN_RIESGO, (NOTA_APROBATORIA, limite, desplazamiento)).fetchall()
+    estudiantes = filas_resumen(conn, filas)
+    conn.close()
+    
+    return {
+        "umbral": NOTA_APROBATORIA,
+        "total": total,
+        "estudiantes": estudiantes
     }
 
 # ---------- RUTA PARA MIGRACIÓN ----------
 @app.route("/migracion.html")
+@login_requerido
 def migracion():
-    if "user_id" not in session:
-        return redirect("/login.html")
-    return render_template("migracion.html")
+    return servir_pagina("migracion.html")
+
+# ---------- ARCHIVOS EN ESPERA DE MIGRACIÓN ----------
+# El archivo de la vista previa queda guardado para que la migración lo lea
+# completo en el servidor, en vez de recibir de vuelta las filas por JSON
+STAGING_DIR = os.path.join(BASE_DIR, "staging")
+STAGING_EXTENSIONES = {'excel': '.xlsx', 'csv': '.csv', 'dbf': '.dbf'}
+STAGING_VIGENCIA = 24 * 60 * 60  # segundos
+
+def guardar_en_staging(file, file_type):
+    os.makedirs(STAGING_DIR, exist_ok=True)
+    
+    # Limpiar archivos que nunca llegaron a migrarse
+    limite = time.time() - STAGING_VIGENCIA
+    for viejo in glob.glob(os.path.join(STAGING_DIR, "*")):
+        try:
+            if os.path.getmtime(viejo) < limite:
+                os.remove(viejo)
+        except OSError:
+            pass
+    
+    archivo_id = uuid.uuid4().hex
+    ruta = os.path.join(STAGING_DIR, archivo_id + STAGING_EXTENSIONES[file_type])
+    file.save(ruta)
+    return archivo_id, ruta
+
+def buscar_en_staging(archivo_id):
+    """Return (ruta, tipo) for a staged file, or None if it does not exist."""
+    if not re.fullmatch(r"[0-9a-f]{32}", str(archivo_id)):
+        return None
+    for tipo, extension in STAGING_EXTENSIONES.items():
+        ruta = os.path.join(STAGING_DIR, archivo_id + extension)
+        if os.path.exists(ruta):
+            return ruta, tipo
+    return None
 
 # ---------- API PARA PREVIEW DE ARCHIVO ----------
 @app.route("/api/migracion/preview", methods=["POST"])
+@login_requerido
 def preview_migracion():
-    if "user_id" not in session:
-        return {"error": "No autorizado"}, 401
-    
     if 'file' not in request.files:
         return {"error": "No se envió ningún archivo"}, 400
     
@@ -597,386 +1845,823 @@ def preview_migracion():
     if file.filename == '':
         return {"error": "Nombre de archivo vacío"}, 400
     
+    if file_type not in STAGING_EXTENSIONES:
+        return {"error": "Tipo de archivo no soportado"}, 400
+    
+    archivo_id, ruta = guardar_en_staging(file, file_type)
+    
     try:
-        import pandas as pd
-        import io
-        
-        # Leer según tipo de archivo
-        if file_type == 'excel':
-            df = pd.read_excel(file, engine='openpyxl')
-        elif file_type == 'csv':
-            # Intentar detectar el delimitador
-            content = file.read().decode('utf-8', errors='replace')
-            file.seek(0)
-            
-            # Detectar si es CSV o TXT con diferentes delimitadores
-            if '\t' in content[:1000]:
-                df = pd.read_csv(io.StringIO(content), sep='\t')
-            elif ';' in content[:1000]:
-                df = pd.read_csv(io.StringIO(content), sep=';')
-            else:
-                df = pd.read_csv(io.StringIO(content))
-        elif file_type == 'dbf':
-            # Para archivos DBF (FoxPro)
-            try:
-                from dbfread import DBF
-                import tempfile
-                import os
-                
-                # Guardar temporalmente el archivo
-                tmp_path = None
-                try:
-                    with tempfile.NamedTemporaryFile(delete=False, suffix='.dbf') as tmp:
-                        tmp_path = tmp.name
-                        file.save(tmp_path)
-                    
-                    # Leer el DBF después de cerrar el archivo temporal
-                    table = DBF(tmp_path, encoding='latin-1')
-                    df = pd.DataFrame(iter(table))
-                finally:
-                    # Asegurar que el archivo se elimine después de leerlo
-                    if tmp_path and os.path.exists(tmp_path):
-                        try:
-                            os.unlink(tmp_path)
-                        except:
-                            pass  # Ignorar errores de eliminación en Windows
-            except ImportError:
-                return {"error": "Librería dbfread no instalada. Ejecuta: pip install dbfread"}, 400
-        else:
-            return {"error": "Tipo de archivo no soportado"}, 400
+        # Leer según tipo de archivo (CSV/TXT detecta el delimitador)
+        try:
+            df = leer_archivo(ruta, file_type)
+        except ImportError:
+            if file_type != 'dbf':
+                raise
+            os.remove(ruta)
+            return {"error": "Librería dbfread no instalada. Ejecuta: pip install dbfread"}, 400
         
-        # Limpiar nombres de columnas
-        df.columns = [str(col).strip() for col in df.columns]
-        
-        # Convertir a formato JSON
-        rows = df.head(100).to_dict(orient='records')  # Solo primeras 100 filas
+        # Solo primeras 100 filas; los escalares de NumPy/pandas y NaN los
+        # convierte el proveedor JSON sin pasar por to_dict
         columns = list(df.columns)
+        rows = [
+            dict(zip(columns, fila))
+            for fila in df.head(100).itertuples(index=False, name=None)
+        ]
         
         return {
+            "archivo_id": archivo_id,
             "columns": columns,
             "rows": rows,
             "total": len(df)
         }
         
     except Exception as e:
+        try:
+            os.remove(ruta)
+        except OSError:
+            pass  # Ignorar errores de eliminación en Windows
         return {"error": f"Error al procesar archivo: {str(e)}"}, 400
 
 # ---------- API PARA EJECUTAR MIGRACIÓN ----------
+# Las importaciones se confirman por bloques y el avance queda en
+# migration_state junto con la huella de los datos: si una migración se corta
+# se reanuda desde el último bloque, y repetir una ya completada no hace nada
+MIGRACION_BLOQUE = 500  # filas (modo básico) o estudiantes (modo completo) por commit
+
+# La solicitud que ejecuta una migración la marca como suya y renueva
+# migration_state.actualizado mientras vive; otra solicitud con los mismos
+# datos solo puede retomarla cuando ese latido venció
+MIGRACION_LATIDO = 10  # segundos entre latidos
+MIGRACION_LATIDO_VENCIDO = 60  # segundos sin latido para darla por abandonada
+
+# La lectura y normalización se reparten en un pool de procesos; solo la
+# escritura final en SQLite queda en un único hilo. Se usa spawn en todas las
+# plataformas: hacer fork de un servidor con hilos de fondo copia sus locks en
+# cualquier estado, y así Linux se comporta igual que Windows y el ejecutable
+IMPORT_WORKERS = os.cpu_count() or 1
+IMPORT_PARALELO_MIN_FILAS = 5000
+IMPORT_PARALELO_MIN_BYTES = 1024 * 1024
+pool_importacion = None
+pool_importacion_lock = threading.Lock()
+
+def obtener_pool_importacion():
+    global pool_importacion
+    with pool_importacion_lock:
+        if pool_importacion is None:
+            pool_importacion = ProcessPoolExecutor(
+                max_workers=IMPORT_WORKERS, mp_context=multiprocessing.get_context("spawn")
+            )
+        return pool_importacion
+
+def mantener_latido(migracion_id, propietario, detener):
+    """Refresh the heartbeat of a claimed migration until detener is set."""
+    while not detener.wait(MIGRACION_LATIDO):
+        conn = get_students_db()
+        try:
+            conn.execute(consultas.LATIDO_MIGRACION, (migracion_id, propietario))
+            conn.commit()
+        except sqlite3.Error:
+            pass  # base ocupada: basta con el siguiente latido
+        finally:
+            conn.close()
+
+def huella_archivo(ruta):
+    digest = hashlib.sha256()
+    with open(ruta, 'rb') as f:
+        for bloque in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(bloque)
+    return digest.hexdigest()
+
+def huella_migracion(origen, mapping, options):
+    """Fingerprint of the source (rows or file hash) and the settings that affect what gets written."""
+    contenido = {
+        "origen": origen,
+        "mapping": mapping,
+        "modo": options.get('migrationMode', 'basic'),
+        "skipDuplicates": options.get('skipDuplicates'),
+        "trimSpaces": options.get('trimSpaces')
+    }
+    if orjson is not None:
+        serializado = orjson.dumps(contenido, option=orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS)
+    else:
+        serializado = json.dumps(contenido, sort_keys=True, default=str).encode("utf-8")
+    return hashlib.sha256(serializado).hexdigest()
+
+def preparar_importacion(rows, staging, mapping, options, modo):
+    """Parse and normalise an import in parallel chunks.
+
+    Returns (filas, unidades, errores): unidades are (fila, student) pairs
+    (basic mode, student None for invalid rows) or (correo, grupo) pairs
+    (complete mode); errores lists (fila, campo, motivo) for rows rejected
+    while normalising. Rows are numbered from 1, after the header.
+    """
+    base = {'mapping': mapping, 'options': options, 'modo': modo}
+    tareas = []
+    
+    if staging:
+        ruta, tipo = staging
+        if tipo == 'csv' and os.path.getsize(ruta) >= IMPORT_PARALELO_MIN_BYTES:
+            # CSV grande: cada proceso lee su propio rango de bytes
+            rangos = planificar_fragmentos_csv(ruta, IMPORT_WORKERS * 2)
+            if len(rangos) > 1:
+                columnas, sep = columnas_csv(ruta)
+                tareas = [
+                    dict(base, ruta=ruta, inicio=inicio, fin=fin, columnas=columnas, sep=sep)
+                    for inicio, fin in rangos
+                ]
+        if not tareas:
+            rows = filas_de_dataframe(leer_archivo(ruta, tipo, dtype=str))
+    
+    if not tareas:
+        if len(rows) >= IMPORT_PARALELO_MIN_FILAS:
+            tamano = -(-len(rows) // (IMPORT_WORKERS * 2))
+            tareas = [dict(base, rows=rows[i:i + tamano]) for i in range(0, len(rows), tamano)]
+        else:
+            tareas = [dict(base, rows=rows)]
+    
+    if len(tareas) > 1:
+        resultados = list(obtener_pool_importacion().map(procesar_fragmento, tareas))
+    else:
+        resultados = [procesar_fragmento(tareas[0])]
+    
+    # Cada fragmento numera sus filas desde 0; se desplazan a la posición en el archivo
+    desplazamientos = []
+    filas = 0
+    for r in resultados:
+        desplazamientos.append(filas + 1)
+        filas += r['filas']
+    
+    errores = [
+        (desplazamiento + indice, campo, motivo)
+        for r, desplazamiento in zip(resultados, desplazamientos)
+        for indice, campo, motivo in r['errores']
+    ]
+    
+    if modo == 'complete':
+        # Unir las agrupaciones parciales por correo, respetando el orden del archivo
+        grupos = {}
+        for r, desplazamiento in zip(resultados, desplazamientos):
+            fusionar_grupos(grupos, r['grupos'], desplazamiento)
+        return filas, list(grupos.items()), errores
+    
+    unidades = [
+        (desplazamiento + indice, est)
+        for r, desplazamiento in zip(resultados, desplazamientos)
+        for indice, est in enumerate(r['estudiantes'])
+    ]
+    return filas, unidades, errores
+
+class FilaInvalida(ValueError):
+    """A student that cannot be imported; campo names the offending field."""
+    
+    def __init__(self, campo, motivo):
+        super().__init__(motivo)
+        self.campo = campo
+
+class MedidorMemoria:
+    """Peak resident memory of this process while migrations run (Linux only).
+
+    The kernel's high-water mark (VmHWM) is reset when the first active
+    migration starts, so each one reports its own peak instead of the whole
+    process lifetime's; overlapping migrations share it. Import pool workers
+    are not counted. Where /proc is not available pico_kb() returns None.
+    """
+    ESTADO = "/proc/self/status"
+    REINICIO = "/proc/self/clear_refs"
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.activas = 0
+        self.disponible = False
+
+    def iniciar(self):
+        with self.lock:
+            if self.activas == 0:
+                try:
+                    with open(self.REINICIO, "w") as f:
+                        f.write("5")  # 5: llevar VmHWM al RSS actual
+                    self.disponible = True
+                except OSError:
+                    self.disponible = False
+            self.activas += 1
+
+    def pico_kb(self):
+        if not self.disponible:
+            return None
+        try:
+            with open(self.ESTADO, encoding="ascii") as f:
+                for linea in f:
+                    if linea.startswith("VmHWM:"):
+                        return int(linea.split()[1])
+        except (OSError, ValueError):
+            pass
+        return None
+
+    def terminar(self):
+        with self.lock:
+            self.activas -= 1
+
+medidor_memoria = MedidorMemoria()
+
+def usuario_actual():
+    """Email of the logged-in user, for audit records."""
+    conn = get_db()
+    user = conn.execute(consultas.USUARIO_POR_ID, (session.get("user_id"),)).fetchone()
+    conn.close()
+    return user[0] if user else "desconocido"
+
+def guardar_errores_migracion(conn, migracion_id, errores):
+    """Bulk-insert (fila, campo, motivo) rows for a migration."""
+    if errores:
+        conn.executemany(
+            consultas.INSERTAR_ERROR_MIGRACION,
+            [(migracion_id, fila, campo, motivo[:500]) for fila, campo, motivo in errores]
+        )
+
+def insertar_estudiante_basico(conn, info, options, existing_emails):
+    """Insert one normalised basic-mode student; returns 'exitoso', 'omitido' or 'error'."""
+    # Filas inválidas llegan como None; su motivo ya quedó registrado al normalizar
+    if info is None:
+        return 'error'
+    
+    # Validar duplicados
+    if options.get('skipDuplicates') and info['correo'] in existing_emails:
+        return 'omitido'
+    
+    # Insertar estudiante
+    conn.execute(consultas.INSERTAR_ESTUDIANTE, (
+        info['nombre'], info['apellido'], info['fecha_nacimiento'],
+        info['telefono'], info['correo'], info['carrera'], info['semestre']
+    ))
+    
+    existing_emails.add(info['correo'])
+    return 'exitoso'
+
+def insertar_estudiante_completo(conn, correo, data, options, existing_emails):
+    """Insert one grouped student with semesters, subjects and evaluations.
+
+    Raises FilaInvalida when the student's info lacks a required field.
+    """
+    info = data['info']
+    campo = campo_faltante(info)
+    if campo:
+        raise FilaInvalida(campo, CAMPO_VACIO)
+    
+    # Validar duplicados
+    if options.get('skipDuplicates') and correo in existing_emails:
+        return 'omitido'
+    
+    # Insertar estudiante
+    cursor = conn.execute(consultas.INSERTAR_ESTUDIANTE, (
+        info['nombre'], info['apellido'], info['fecha_nacimiento'],
+        info['telefono'], info['correo'], info['carrera'], info['semestre']
+    ))
+    
+    student_id = cursor.lastrowid
+    resumen = []
+    
+    # Insertar semestres, materias y evaluaciones
+    for (sem_num, sem_anio), sem_data in data['semesters'].items():
+        # Insertar semestre
+        cursor = conn.execute(consultas.INSERTAR_SEMESTRE, (student_id, sem_num, sem_anio))
+        semester_id = cursor.lastrowid
+        notas_finales = []
+        
+        for materia_nombre, evaluaciones in sem_data['subjects'].items():
+            # Calcular nota final
+            nota_final = 0
+            total_porcentaje = 0
+            for ev in evaluaciones:
+                nota_final += ev['nota'] * (ev['porcentaje'] / 100)
+                total_porcentaje += ev['porcentaje']
+            
+            if total_porcentaje > 0 and total_porcentaje != 100:
+                nota_final = (nota_final / total_porcentaje) * 100
+            
+            # Insertar materia
+            cursor = conn.execute(
+                consultas.INSERTAR_MATERIA,
+                (semester_id, materia_nombre, round(nota_final, 2))
+            )
+            subject_id = cursor.lastrowid
+            notas_finales.append(round(nota_final, 2))
+            
+            # Insertar evaluaciones
+            conn.executemany(
+                consultas.INSERTAR_EVALUACION,
+                [(subject_id, ev['evaluacion'], ev['nota'], ev['porcentaje']) for ev in evaluaciones]
+            )
+        
+        resumen.append((semester_id, sem_num, sem_anio, notas_finales))
+    
+    sumar_notas_resumen(conn, student_id, resumen)
+    existing_emails.add(correo)
+    return 'exitoso'
+
 @app.route("/api/migracion/ejecutar", methods=["POST"])
+@login_requerido
 def ejecutar_migracion():
-    if "user_id" not in session:
-        return {"error": "No autorizado"}, 401
-    
+    inicio = time.perf_counter()
     data = request.get_json()
     rows = data.get('data', [])
     mapping = data.get('mapping', {})
     options = data.get('options', {})
     
-    success_count = 0
-    skipped_count = 0
-    error_count = 0
+    # Si la vista previa dejó el archivo en staging se lee completo desde ahí
+    staging = None
+    if data.get('archivo_id'):
+        staging = buscar_en_staging(data['archivo_id'])
+        if staging is None:
+            return {"error": "Archivo no encontrado, vuelve a cargarlo"}, 404
+    
+    # Datos del historial: el nombre lo envía el cliente, el tipo sale del staging
+    archivo = re.split(r"[\\/]", str(data.get('archivo') or '').strip())[-1][:255] or "Datos enviados"
+    if staging:
+        tipo_archivo = staging[1]
+    elif data.get('tipo') in STAGING_EXTENSIONES:
+        tipo_archivo = data['tipo']
+    else:
+        tipo_archivo = 'json'
+    usuario = usuario_actual()
     
     conn = get_students_db()
     
+    # Una migración ya completada con los mismos datos no se repite
+    origen = {"archivo": huella_archivo(staging[0])} if staging else rows
+    huella = huella_migracion(origen, mapping, options)
+    estado = conn.execute(consultas.ESTADO_MIGRACION_POR_HUELLA, (huella,)).fetchone()
+    
+    if estado and estado["estado"] == 'completada':
+        conn.close()
+        if staging:
+            try:
+                os.remove(staging[0])
+            except OSError:
+                pass
+        return {
+            "success": True,
+            "total": estado["total"],
+            "successful": estado["exitosos"],
+            "skipped": estado["omitidos"],
+            "errors": estado["errores"],
+            "migracion_id": estado["id"],
+            "ya_migrada": True
+        }
+    
+    # Reclamar la migración antes de leer los datos: un reintento que llega
+    # mientras la solicitud original sigue viva recibe 409 en lugar de
+    # insertar los mismos bloques otra vez
+    propietario = uuid.uuid4().hex
+    if estado is None:
+        try:
+            migracion_id = conn.execute(
+                consultas.INSERTAR_ESTADO_MIGRACION, (huella, MIGRACION_BLOQUE, propietario)
+            ).lastrowid
+            conn.commit()
+        except sqlite3.IntegrityError:
+            conn.rollback()
+            conn.close()
+            return {"error": "Esta migración ya se está ejecutando en otra solicitud"}, 409
+    else:
+        migracion_id = estado["id"]
+        estado = conn.execute(consultas.RECLAMAR_MIGRACION, {
+            "propietario": propietario,
+            "id": migracion_id,
+            "vencido": f"-{MIGRACION_LATIDO_VENCIDO} seconds"
+        }).fetchone()
+        conn.commit()
+        if estado is None:
+            conn.close()
+            return {
+                "error": "Esta migración ya se está ejecutando en otra solicitud",
+                "migracion_id": migracion_id
+            }, 409
+    
+    detener_latido = threading.Event()
+    threading.Thread(
+        target=mantener_latido, args=(migracion_id, propietario, detener_latido),
+        name="latido-migracion", daemon=True
+    ).start()
+    
+    medidor_memoria.iniciar()
+    try:
+        return migrar_reclamada(conn, migracion_id, propietario, estado, inicio, rows, staging,
+                                mapping, options, archivo, tipo_archivo, usuario)
+    except BaseException:
+        # Liberarla para que un reintento la retome sin esperar a que venza el latido
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+            conn.execute(consultas.LIBERAR_MIGRACION, (migracion_id, propietario))
+            conn.commit()
+            conn.close()
+        except sqlite3.Error:
+            pass
+        raise
+    finally:
+        detener_latido.set()
+        medidor_memoria.terminar()
+
+def migrar_reclamada(conn, migracion_id, propietario, estado, inicio, rows, staging,
+                     mapping, options, archivo, tipo_archivo, usuario):
+    """Body of ejecutar_migracion once this request owns the migration_state row."""
     # Obtener correos existentes para detectar duplicados
     existing_emails = set()
     if options.get('skipDuplicates', True):
-        result = conn.execute("SELECT correo FROM estudiantes").fetchall()
+        result = conn.execute(consultas.CORREOS_ESTUDIANTES).fetchall()
         existing_emails = {row['correo'].lower() for row in result}
     
     migration_mode = options.get('migrationMode', 'basic')
     
+    # Progreso en vivo por el feed de cambios; el token permite al cliente
+    # reconocer los eventos de su propia migración
+    progress_token = options.get('progressToken')
+    
+    def publicar_progreso(procesados, total, estado='procesando'):
+        canal_cambios.publicar("migracion", {
+            "token": progress_token,
+            "estado": estado,
+            "procesados": procesados,
+            "total": total
+        })
+    
+    publicar_progreso(0, 0, 'iniciada')
+    
+    # Lectura y normalización en paralelo (en modo completo, agrupadas por correo)
+    total_filas, unidades, errores_normalizacion = preparar_importacion(
+        rows, staging, mapping, options, migration_mode
+    )
+    
     if migration_mode == 'complete':
-        # Modo completo: agrupar por estudiante y procesar datos académicos
-        from collections import defaultdict
+        def procesar(unidad):
+            return insertar_estudiante_completo(conn, unidad[0], unidad[1], options, existing_emails)
         
-        students_data = defaultdict(lambda: {
-            'info': None,
-            'semesters': defaultdict(lambda: {
-                'subjects': defaultdict(list)
-            })
-        })
+        def fila_de(unidad):
+            return unidad[1]['fila']
         
-        # Agrupar filas por estudiante (correo)
-        for row in rows:
-            try:
-                correo = str(row.get(mapping.get('correo', ''), '')).strip().lower()
-                if not correo:
-                    continue
-                
-                # Extraer info del estudiante (solo la primera vez)
-                if students_data[correo]['info'] is None:
-                    nombre = row.get(mapping.get('nombre', ''), '').strip() if options.get('trimSpaces') else row.get(mapping.get('nombre', ''), '')
-                    apellido = row.get(mapping.get('apellido', ''), '').strip() if options.get('trimSpaces') else row.get(mapping.get('apellido', ''), '')
-                    fecha_nacimiento = str(row.get(mapping.get('fecha_nacimiento', ''), '')).strip()
-                    telefono = str(row.get(mapping.get('telefono', ''), '')).strip()
-                    carrera = normalizar_texto(row.get(mapping.get('carrera', ''), '').strip() if options.get('trimSpaces') else row.get(mapping.get('carrera', ''), ''))
-                    semestre_num = row.get(mapping.get('semestre', ''), 1)
-                    
-                    try:
-                        semestre_num = int(float(str(semestre_num)))
-                    except:
-                        semestre_num = 1
-                    
-                    students_data[correo]['info'] = {
-                        'nombre': nombre,
-                        'apellido': apellido,
-                        'fecha_nacimiento': fecha_nacimiento,
-                        'telefono': telefono,
-                        'correo': correo,
-                        'carrera': carrera,
-                        'semestre': semestre_num
-                    }
-                
-                # Extraer datos académicos si existen
-                semestre_num = row.get(mapping.get('semestre', ''), 1)
-                semestre_anio = row.get(mapping.get('semestre_anio', ''), 2024)
-                materia = str(row.get(mapping.get('materia', ''), '')).strip()
-                evaluacion = str(row.get(mapping.get('evaluacion', ''), '')).strip()
-                nota = row.get(mapping.get('nota', ''), 0)
-                porcentaje = row.get(mapping.get('porcentaje', ''), 0)
-                
-                try:
-                    semestre_num = int(float(str(semestre_num)))
-                except:
-                    semestre_num = 1
-                
-                try:
-                    semestre_anio = int(float(str(semestre_anio)))
-                except:
-                    semestre_anio = 2024
-                
-                try:
-                    nota = float(str(nota))
-                except:
-                    nota = 0
-                
-                try:
-                    porcentaje = int(float(str(porcentaje)))
-                except:
-                    porcentaje = 0
-                
-                if materia and evaluacion:
-                    sem_key = (semestre_num, semestre_anio)
-                    students_data[correo]['semesters'][sem_key]['subjects'][materia].append({
-                        'evaluacion': evaluacion,
-                        'nota': nota,
-                        'porcentaje': porcentaje
-                    })
-            except Exception as e:
-                error_count += 1
-                continue
+        # En modo completo cada fila descartada al agrupar cuenta como error
+        errores_iniciales = len(errores_normalizacion)
+    else:
+        def procesar(unidad):
+            return insertar_estudiante_basico(conn, unidad[1], options, existing_emails)
         
-        # Insertar estudiantes con datos académicos
-        for correo, data in students_data.items():
-            try:
-                info = data['info']
-                if not info or not all([info['nombre'], info['apellido'], info['correo'], info['carrera']]):
-                    error_count += 1
-                    continue
-                
-                # Validar duplicados
-                if options.get('skipDuplicates') and correo in existing_emails:
-                    skipped_count += 1
-                    continue
-                
-                # Insertar estudiante
-                cursor = conn.execute("""
-                    INSERT INTO estudiantes (
-                        nombre, apellido, fecha_nacimiento,
-                        telefono, correo, carrera, semestre
-                    ) VALUES (?, ?, ?, ?, ?, ?, ?)
-                """, (info['nombre'], info['apellido'], info['fecha_nacimiento'], 
-                      info['telefono'], info['correo'], info['carrera'], info['semestre']))
-                
-                student_id = cursor.lastrowid
-                
-                # Insertar semestres, materias y evaluaciones
-                for (sem_num, sem_anio), sem_data in data['semesters'].items():
-                    # Insertar semestre
-                    cursor = conn.execute("""
-                        INSERT INTO semesters (student_id, semestre, año, estado)
-                        VALUES (?, ?, ?, 'activo')
-                    """, (student_id, sem_num, sem_anio))
-                    semester_id = cursor.lastrowid
-                    
-                    for materia_nombre, evaluaciones in sem_data['subjects'].items():
-                        # Calcular nota final
-                        nota_final = 0
-                        total_porcentaje = 0
-                        for ev in evaluaciones:
-                            nota_final += ev['nota'] * (ev['porcentaje'] / 100)
-                            total_porcentaje += ev['porcentaje']
-                        
-                        if total_porcentaje > 0 and total_porcentaje != 100:
-                            nota_final = (nota_final / total_porcentaje) * 100
-                        
-                        # Insertar materia
-                        cursor = conn.execute("""
-                            INSERT INTO subjects (semester_id, nombre, nota_final)
-                            VALUES (?, ?, ?)
-                        """, (semester_id, materia_nombre, round(nota_final, 2)))
-                        subject_id = cursor.lastrowid
-                        
-                        # Insertar evaluaciones
-                        for ev in evaluaciones:
-                            conn.execute("""
-                                INSERT INTO evaluations (subject_id, nombre, nota, porcentaje)
-                                VALUES (?, ?, ?, ?)
-                            """, (subject_id, ev['evaluacion'], ev['nota'], ev['porcentaje']))
-                
-                existing_emails.add(correo)
-                success_count += 1
-                
-            except Exception as e:
-                error_count += 1
-                continue
+        def fila_de(unidad):
+            return unidad[0]
+        
+        # En modo básico las filas inválidas se cuentan al recorrer los bloques
+        errores_iniciales = 0
+    
+    bloques = [
+        unidades[inicio:inicio + MIGRACION_BLOQUE]
+        for inicio in range(0, len(unidades), MIGRACION_BLOQUE)
+    ]
+    
+    # Reanudar desde el último bloque confirmado, o empezar de cero
+    if estado and estado["bloques_completados"] > 0 and estado["bloque"] == MIGRACION_BLOQUE:
+        bloques_completados = estado["bloques_completados"]
+        success_count = estado["exitosos"]
+        skipped_count = estado["omitidos"]
+        error_count = estado["errores"]
     else:
-        # Modo básico: solo estudiantes sin datos académicos
-        for row in rows:
-            try:
-                # Extraer datos según mapeo
-                nombre = row.get(mapping.get('nombre', ''), '').strip() if options.get('trimSpaces') else row.get(mapping.get('nombre', ''), '')
-                apellido = row.get(mapping.get('apellido', ''), '').strip() if options.get('trimSpaces') else row.get(mapping.get('apellido', ''), '')
-                fecha_nacimiento = str(row.get(mapping.get('fecha_nacimiento', ''), '')).strip()
-                telefono = str(row.get(mapping.get('telefono', ''), '')).strip()
-                correo = str(row.get(mapping.get('correo', ''), '')).strip().lower()
-                carrera = row.get(mapping.get('carrera', ''), '').strip() if options.get('trimSpaces') else row.get(mapping.get('carrera', ''), '')
-                semestre = row.get(mapping.get('semestre', ''), 1)
-                
-                # Validar campos requeridos
-                if not all([nombre, apellido, correo, carrera]):
-                    error_count += 1
-                    continue
-                
-                # Validar duplicados
-                if options.get('skipDuplicates') and correo in existing_emails:
-                    skipped_count += 1
-                    continue
-                
-                # Convertir semestre a entero
-                try:
-                    semestre = int(semestre)
-                except (ValueError, TypeError):
-                    semestre = 1
-                
-                # Insertar estudiante
-                conn.execute("""
-                    INSERT INTO estudiantes (
-                        nombre, apellido, fecha_nacimiento,
-                        telefono, correo, carrera, semestre
-                    ) VALUES (?, ?, ?, ?, ?, ?, ?)
-                """, (nombre, apellido, fecha_nacimiento, telefono, correo, carrera, semestre))
-                
-                existing_emails.add(correo)
-                success_count += 1
-                
-            except Exception as e:
-                error_count += 1
-                continue
+        conn.execute(consultas.ELIMINAR_ERRORES_MIGRACION, (migracion_id,))
+        conn.execute(
+            consultas.REINICIAR_MIGRACION,
+            (total_filas, MIGRACION_BLOQUE, migracion_id, propietario)
+        )
+        guardar_errores_migracion(conn, migracion_id, errores_normalizacion)
+        conn.commit()
+        bloques_completados = 0
+        success_count = 0
+        skipped_count = 0
+        error_count = errores_iniciales
     
-    conn.commit()
+    reanudada = bloques_completados > 0
     
-    # Guardar en historial
-    try:
-        conn.execute("""
-            CREATE TABLE IF NOT EXISTS migration_history (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                fecha TEXT NOT NULL,
-                archivo TEXT NOT NULL,
-                tipo TEXT NOT NULL,
-                registros INTEGER NOT NULL,
-                exitosos INTEGER NOT NULL,
-                omitidos INTEGER NOT NULL,
-                errores INTEGER NOT NULL,
-                usuario TEXT NOT NULL
-            )
-        """)
+    for numero, bloque in enumerate(bloques[bloques_completados:], bloques_completados + 1):
+        contadores = {'exitoso': 0, 'omitido': 0, 'error': 0}
+        errores_bloque = []
         
-        import datetime
-        conn.execute("""
-            INSERT INTO migration_history (fecha, archivo, tipo, registros, exitosos, omitidos, errores, usuario)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-        """, (
-            datetime.datetime.now().strftime("%Y-%m-%d %H:%M"),
-            "Archivo importado",
-            "excel",
-            len(rows),
-            success_count,
-            skipped_count,
-            error_count,
-            "Dr. Roberto Sánchez"
-        ))
+        # Transacción explícita: así liberar un savepoint no confirma el bloque
+        if not conn.in_transaction:
+            conn.execute("BEGIN")
+        for unidad in bloque:
+            # Un savepoint por unidad: si falla, no deja filas a medias en el bloque
+            conn.execute("SAVEPOINT unidad")
+            try:
+                resultado = procesar(unidad)
+                conn.execute("RELEASE SAVEPOINT unidad")
+            except Exception as e:
+                conn.execute("ROLLBACK TO SAVEPOINT unidad")
+                conn.execute("RELEASE SAVEPOINT unidad")
+                resultado = 'error'
+                errores_bloque.append((fila_de(unidad), getattr(e, 'campo', None), str(e)))
+            contadores[resultado] += 1
+        
+        guardar_errores_migracion(conn, migracion_id, errores_bloque)
+        
+        success_count += contadores['exitoso']
+        skipped_count += contadores['omitido']
+        error_count += contadores['error']
+        
+        # El avance se confirma en la misma transacción que las filas del bloque;
+        # si otra solicitud tomó la migración, este bloque se descarta
+        avance = conn.execute(
+            consultas.AVANCE_MIGRACION,
+            (numero, success_count, skipped_count, error_count, migracion_id, propietario)
+        )
+        if avance.rowcount == 0:
+            conn.rollback()
+            conn.close()
+            return {"error": "Otra solicitud retomó esta migración"}, 409
         conn.commit()
-    except:
-        pass
+        
+        publicar_progreso(min(numero * MIGRACION_BLOQUE, len(unidades)), len(unidades))
+    
+    # Guardar en historial, con las métricas de esta ejecución
+    duracion = time.perf_counter() - inicio
+    registro = {
+        "fecha": datetime.datetime.now().strftime("%Y-%m-%d %H:%M"),
+        "archivo": archivo,
+        "tipo": tipo_archivo,
+        "registros": total_filas,
+        "exitosos": success_count,
+        "omitidos": skipped_count,
+        "errores": error_count,
+        "usuario": usuario,
+        "migracion_id": migracion_id,
+        "modo": migration_mode,
+        "duracion": round(duracion, 3),
+        "filas_por_segundo": round(total_filas / duracion, 1) if duracion > 0 else None,
+        "memoria_pico_kb": medidor_memoria.pico_kb()
+    }
+    cursor = conn.execute(consultas.INSERTAR_HISTORIAL_MIGRACION, registro)
+    historial_id = cursor.lastrowid
+    registrar_cambio(conn, "migracion", "insert", historial_id, registro)
     
+    if conn.execute(consultas.COMPLETAR_MIGRACION, (migracion_id, propietario)).rowcount == 0:
+        conn.rollback()
+        conn.close()
+        return {"error": "Otra solicitud retomó esta migración"}, 409
+    conn.commit()
+    
+    mantenimiento.registrar_escrituras(conn.total_changes)
     conn.close()
     
+    # El archivo ya no hace falta; repetirlo se detecta por su huella
+    if staging:
+        try:
+            os.remove(staging[0])
+        except OSError:
+            pass
+    canal_cambios.notificar()
+    publicar_progreso(len(unidades), len(unidades), 'completada')
+    
     return {
         "success": True,
-        "total": len(rows),
-        "success": success_count,
+        "total": total_filas,
+        "successful": success_count,
         "skipped": skipped_count,
-        "errors": error_count
+        "errors": error_count,
+        "migracion_id": migracion_id,
+        "historial_id": historial_id,
+        "duracion": registro["duracion"],
+        "filas_por_segundo": registro["filas_por_segundo"],
+        "reanudada": reanudada
     }
 
 # ---------- API PARA HISTORIAL DE MIGRACIONES ----------
+HISTORIAL_LIMITE = 10
+HISTORIAL_LIMITE_MAX = 100
+ERRORES_LIMITE_MAX = 1000
+
+def entero_param(nombre, defecto, maximo=None, minimo=1):
+    """Integer query parameter clamped to [minimo, maximo]; cursors and offsets use minimo=0."""
+    try:
+        valor = int(request.args.get(nombre, defecto))
+    except (TypeError, ValueError):
+        valor = defecto
+    valor = max(minimo, valor)
+    return min(valor, maximo) if maximo else valor
+
 @app.route("/api/migracion/historial", methods=["GET"])
+@login_requerido
 def historial_migracion():
-    if "user_id" not in session:
-        return {"error": "No autorizado"}, 401
+    # Paginación por cursor: ?antes=<id> devuelve las migraciones anteriores a ese id
+    limite = entero_param("limite", HISTORIAL_LIMITE, HISTORIAL_LIMITE_MAX)
+    filtros = [request.args[f] for f in ("usuario", "tipo") if request.args.get(f)]
+    consulta = consultas.HISTORIAL_MIGRACIONES[
+        (bool(request.args.get("usuario")), bool(request.args.get("tipo")))
+    ]
+    # Sin cursor se parte del id más alto posible
+    antes = entero_param("antes", sys.maxsize, minimo=0)
     
     conn = get_students_db()
+    historial = conn.execute(consulta, filtros + [antes, limite + 1]).fetchall()
+    conn.close()
     
-    try:
-        # Verificar si existe la tabla
-        conn.execute("""
-            CREATE TABLE IF NOT EXISTS migration_history (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                fecha TEXT NOT NULL,
-                archivo TEXT NOT NULL,
-                tipo TEXT NOT NULL,
-                registros INTEGER NOT NULL,
-                exitosos INTEGER NOT NULL,
-                omitidos INTEGER NOT NULL,
-                errores INTEGER NOT NULL,
-                usuario TEXT NOT NULL
-            )
-        """)
-        
-        historial = conn.execute("""
-            SELECT fecha, archivo, tipo, registros, exitosos, omitidos, errores, usuario
-            FROM migration_history
-            ORDER BY id DESC
-            LIMIT 10
-        """).fetchall()
-        
+    siguiente = historial[limite - 1]["id"] if len(historial) > limite else None
+    return {
+        "historial": [dict(row) for row in historial[:limite]],
+        "siguiente": siguiente
+    }
+
+@app.route("/api/migracion/historial/<int:historial_id>/errores", methods=["GET"])
+@login_requerido
+def errores_migracion(historial_id):
+    conn = get_students_db()
+    migracion = conn.execute(consultas.MIGRACION_DE_HISTORIAL, (historial_id,)).fetchone()
+    if migracion is None:
+        conn.close()
+        return {"error": "Migración no encontrada"}, 404
+    
+    # Reporte completo descargable
+    if request.args.get("formato") == "csv":
+        errores = conn.execute(consultas.ERRORES_MIGRACION, (migracion["migracion_id"],)).fetchall()
         conn.close()
         
-        return {
-            "historial": [
-                {
-                    "fecha": row["fecha"],
-                    "archivo": row["archivo"],
-                    "tipo": row["tipo"],
-                    "registros": row["registros"],
-                    "exitosos": row["exitosos"],
-                    "omitidos": row["omitidos"],
-                    "errores": row["errores"],
-                    "usuario": row["usuario"]
-                }
-                for row in historial
-            ]
+        salida = io.StringIO()
+        escritor = csv.writer(salida)
+        escritor.writerow(["fila", "campo", "motivo"])
+        escritor.writerows(tuple(row) for row in errores)
+        nombre = f"errores_migracion_{historial_id}.csv"
+        return Response(
+            salida.getvalue().encode("utf-8-sig"),  # con BOM para que Excel respete los acentos
+            mimetype="text/csv",
+            headers={"Content-Disposition": f'attachment; filename="{nombre}"'}
+        )
+    
+    # Página en JSON, por cursor de id: ?desde=<id> devuelve los errores siguientes
+    limite = entero_param("limite", 100, ERRORES_LIMITE_MAX)
+    desde = entero_param("desde", 0, minimo=0)
+    errores = conn.execute(
+        consultas.PAGINA_ERRORES_MIGRACION,
+        (migracion["migracion_id"], desde, limite + 1)
+    ).fetchall()
+    conn.close()
+    
+    siguiente = errores[limite - 1]["id"] if len(errores) > limite else None
+    return {
+        "archivo": migracion["archivo"],
+        "errores": [dict(row) for row in errores[:limite]],
+        "siguiente": siguiente
+    }
+
+# ---------- API PARA SESIONES ACTIVAS ----------
+@app.route("/api/sesiones", methods=["GET"])
+@login_requerido
+def sesiones_activas():
+    return {
+        "activas": almacen_sesiones.contar_activas(),
+        "en_cache": almacen_sesiones.contar_en_cache()
+    }
+
+# ---------- API PARA FEED DE CAMBIOS (SSE) ----------
+@app.route("/api/cambios/stream", methods=["GET"])
+@login_requerido
+def stream_cambios():
+    # Se reanuda desde Last-Event-ID (reconexión) o ?desde=; si no, desde ahora
+    ultimo_id = request.headers.get("Last-Event-ID", type=int)
+    if ultimo_id is None:
+        ultimo_id = request.args.get("desde", type=int)
+    
+    conn = get_students_db()
+    if ultimo_id is None:
+        ultimo_id = conn.execute(consultas.ULTIMO_CAMBIO).fetchone()["ultimo"]
+    conn.close()
+    
+    _, ultimo_seq = canal_cambios.efimeros_desde(0)
+    
+    def generar(ultimo_id, ultimo_seq):
+        conn = get_students_db()
+        sin_eventos = 0
+        try:
+            yield "retry: 3000\n\n"
+            while True:
+                version = canal_cambios.version
+                
+                cambios = conn.execute(consultas.CAMBIOS_DESDE, (ultimo_id, CAMBIOS_LOTE)).fetchall()
+                
+                for cambio in cambios:
+                    ultimo_id = cambio["id"]
+                    yield formato_sse("cambio", {
+                        "entidad": cambio["entidad"],
+                        "accion": cambio["accion"],
+                        "id": cambio["entidad_id"],
+                        "datos": json.loads(cambio["datos"]) if cambio["datos"] else None,
+                        "fecha": cambio["fecha"]
+                    }, ultimo_id)
+                
+                efimeros, ultimo_seq = canal_cambios.efimeros_desde(ultimo_seq)
+                for _, evento, datos in efimeros:
+                    yield formato_sse(evento, datos)
+                
+                if len(cambios) == CAMBIOS_LOTE:
+                    continue
+                
+                if cambios or efimeros:
+                    sin_eventos = 0
+                elif sin_eventos >= CAMBIOS_HEARTBEAT:
+                    yield ": ping\n\n"
+                    sin_eventos = 0
+                
+                if canal_cambios.esperar(version, CAMBIOS_POLL) == version:
+                    sin_eventos += CAMBIOS_POLL
+        finally:
+            conn.close()
+    
+    return Response(
+        generar(ultimo_id, ultimo_seq),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+# ---------- API PARA ARCHIVO DE HISTORIALES ----------
+@app.route("/api/archivo", methods=["GET"])
+@login_requerido
+def estado_archivo():
+    conn = get_students_db_historico()
+    
+    resultado = {}
+    for tabla, (activos, archivados) in consultas.CONTEO_ARCHIVO.items():
+        resultado[tabla] = {
+            "activos": conn.execute(activos).fetchone()[0],
+            "archivados": conn.execute(archivados).fetchone()[0]
         }
-    except Exception as e:
+    
+    conn.close()
+    return resultado
+
+@app.route("/api/archivo/ejecutar", methods=["POST"])
+@login_requerido
+def ejecutar_archivo():
+    data = request.get_json(silent=True) or {}
+    antes_de_anio = data.get("antes_de_anio")
+    lote = data.get("lote", ARCHIVO_LOTE)
+    
+    # bool es subclase de int: true no debe pasar por un lote de 1
+    if type(lote) is not int or lote <= 0:
+        return {"error": "El lote debe ser un entero positivo"}, 400
+    # Un texto se compararía con año como texto y cerraría todos los semestres
+    if antes_de_anio is not None and type(antes_de_anio) is not int:
+        return {"error": "antes_de_anio debe ser un año entero"}, 400
+    
+    # Opcionalmente cerrar primero los semestres de años anteriores
+    cerrados = 0
+    if antes_de_anio is not None:
+        conn = get_students_db()
+        cerrados = conn.execute(consultas.CERRAR_SEMESTRES_ANTERIORES, (antes_de_anio,)).rowcount
+        conn.commit()
         conn.close()
-        return {"historial": []}
+    
+    return {"success": True, "cerrados": cerrados, **archivar_semestres(lote)}
+
+# ---------- API PARA MANTENIMIENTO DE LA BASE DE DATOS ----------
+@app.route("/api/admin/mantenimiento", methods=["GET"])
+@login_requerido
+def estado_mantenimiento():
+    return mantenimiento.estado()
+
+@app.route("/api/admin/mantenimiento", methods=["POST"])
+@login_requerido
+def ejecutar_mantenimiento():
+    data = request.get_json()
+    tarea = data.get("tarea")
+    
+    if tarea not in MantenimientoBD.TAREAS:
+        return {"error": "Tarea no válida", "tareas": list(MantenimientoBD.TAREAS)}, 400
+    
+    return {"tarea": tarea, **mantenimiento.ejecutar(tarea)}
+
+@app.route("/api/admin/resumen", methods=["POST"])
+@login_requerido
+def reconstruir_resumen_academico():
+    # Recalcula el resumen completo, p. ej. tras editar notas fuera de la API
+    inicio = time.time()
+    conn = get_students_db_historico()
+    estudiantes = reconstruir_resumen(conn)
+    conn.commit()
+    conn.close()
+    return {"estudiantes": estudiantes, "duracion": round(time.time() - inicio, 3)}
+
+@app.route("/api/admin/analitica", methods=["GET"])
+@login_requerido
+def estado_analitica():
+    if not analitica_columnar:
+        return {"error": "Analítica columnar no disponible"}, 503
+    return analitica_columnar.estado()
+
+@app.route("/api/admin/analitica", methods=["POST"])
+@login_requerido
+def renovar_analitica():
+    # Instantánea inmediata, p. ej. tras una migración grande
+    if not analitica_columnar:
+        return {"error": "Analítica columnar no disponible"}, 503
+    return analitica_columnar.renovar()
 
 # ---------- LOGOUT ----------
 @app.route("/logout")
 def logout():
-    session.pop("user_id", None)
+    session.clear()
     return redirect("/login.html")
 
 # ---------- EJECUCIÓN ----------
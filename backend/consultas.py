@@ -0,0 +1,853 @@
+# Catálogo central de las sentencias SQL de la aplicación.
+# Cada consulta se registra con un nombre, la base en la que corre y los pasos
+# SCAN / TEMP B-TREE que se aceptan en su plan; verificar_consultas.py revisa
+# con EXPLAIN QUERY PLAN todas las del catálogo contra una base sembrada.
+# Este módulo no tiene efectos al importarse.
+
+CATALOGO = {}
+
+# Pasos de plan que aparecen en casi todas las consultas y no son un problema
+ORDEN_TEMPORAL = "USE TEMP B-TREE FOR ORDER BY"
+AGRUPACION_TEMPORAL = "USE TEMP B-TREE FOR GROUP BY"
+
+class Consulta(str):
+    """SQL statement registered in CATALOGO; usable anywhere the SQL text is.
+
+    base is the database it runs on: 'usuarios', 'estudiantes' or 'historico'
+    (students with the archive attached and the todos_* views). params are
+    sample values for the plan checker (1 per placeholder when omitted) and
+    permitir lists the SCAN / TEMP B-TREE steps its plan may contain.
+    """
+
+    def __new__(cls, nombre, sql, base="estudiantes", params=None, permitir=()):
+        if nombre in CATALOGO:
+            raise ValueError(f"Consulta duplicada en el catálogo: {nombre}")
+        consulta = super().__new__(cls, sql)
+        consulta.nombre = nombre
+        consulta.base = base
+        consulta.params = params
+        consulta.permitir = tuple(permitir)
+        CATALOGO[nombre] = consulta
+        return consulta
+
+# ---------- ESQUEMA ----------
+ESQUEMA_USUARIOS = [
+    """
+    CREATE TABLE IF NOT EXISTS users (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        email TEXT UNIQUE NOT NULL,
+        password_hash TEXT NOT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    """,
+    # Sesiones del lado del servidor (la cookie solo lleva el id)
+    """
+    CREATE TABLE IF NOT EXISTS sesiones (
+        id TEXT PRIMARY KEY,
+        datos TEXT NOT NULL,
+        expira REAL NOT NULL
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_sesiones_expira ON sesiones(expira)",
+]
+
+ESQUEMA_ESTUDIANTES = [
+    # Tabla principal de estudiantes
+    """
+    CREATE TABLE IF NOT EXISTS estudiantes (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        nombre TEXT NOT NULL,
+        apellido TEXT NOT NULL,
+        fecha_nacimiento TEXT NOT NULL,
+        telefono TEXT NOT NULL,
+        correo TEXT NOT NULL,
+        carrera TEXT NOT NULL,
+        semestre INTEGER NOT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    """,
+    # Tabla de semestres cursados por estudiante
+    """
+    CREATE TABLE IF NOT EXISTS semesters (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        student_id INTEGER NOT NULL,
+        semestre INTEGER NOT NULL,
+        año INTEGER NOT NULL,
+        estado TEXT DEFAULT 'activo',
+        FOREIGN KEY (student_id) REFERENCES estudiantes(id)
+    )
+    """,
+    # Tabla de materias por semestre
+    """
+    CREATE TABLE IF NOT EXISTS subjects (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        semester_id INTEGER NOT NULL,
+        nombre TEXT NOT NULL,
+        nota_final REAL,
+        FOREIGN KEY (semester_id) REFERENCES semesters(id)
+    )
+    """,
+    # Tabla de evaluaciones por materia
+    """
+    CREATE TABLE IF NOT EXISTS evaluations (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        subject_id INTEGER NOT NULL,
+        nombre TEXT NOT NULL,
+        nota REAL NOT NULL,
+        porcentaje INTEGER NOT NULL,
+        FOREIGN KEY (subject_id) REFERENCES subjects(id)
+    )
+    """,
+    # Índices de las claves foráneas, del listado y de los agrupamientos del dashboard
+    "CREATE INDEX IF NOT EXISTS idx_semesters_student ON semesters(student_id)",
+    # Solo los semestres cerrados: cada lote del archivado lee de aquí sin recorrer los activos
+    "CREATE INDEX IF NOT EXISTS idx_semesters_cerrados ON semesters(id) WHERE estado <> 'activo'",
+    "CREATE INDEX IF NOT EXISTS idx_subjects_semester ON subjects(semester_id)",
+    "CREATE INDEX IF NOT EXISTS idx_evaluations_subject ON evaluations(subject_id)",
+    "CREATE INDEX IF NOT EXISTS idx_estudiantes_created ON estudiantes(created_at)",
+    "CREATE INDEX IF NOT EXISTS idx_estudiantes_carrera ON estudiantes(carrera)",
+    "CREATE INDEX IF NOT EXISTS idx_estudiantes_semestre ON estudiantes(semestre)",
+    "CREATE INDEX IF NOT EXISTS idx_subjects_nombre ON subjects(nombre, nota_final)",
+    # Registro de cambios para el feed en vivo (SSE)
+    """
+    CREATE TABLE IF NOT EXISTS change_log (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        entidad TEXT NOT NULL,
+        accion TEXT NOT NULL,
+        entidad_id INTEGER,
+        datos TEXT,
+        fecha TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    """,
+    # Avance de cada migración, para reanudarla o no repetirla
+    """
+    CREATE TABLE IF NOT EXISTS migration_state (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        huella TEXT UNIQUE NOT NULL,
+        estado TEXT NOT NULL,
+        total INTEGER NOT NULL,
+        bloque INTEGER NOT NULL,
+        bloques_completados INTEGER NOT NULL DEFAULT 0,
+        exitosos INTEGER NOT NULL DEFAULT 0,
+        omitidos INTEGER NOT NULL DEFAULT 0,
+        errores INTEGER NOT NULL DEFAULT 0,
+        creado TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        actualizado TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    """,
+    # Historial de migraciones con sus métricas (ver COLUMNAS_AGREGADAS)
+    """
+    CREATE TABLE IF NOT EXISTS migration_history (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        fecha TEXT NOT NULL,
+        archivo TEXT NOT NULL,
+        tipo TEXT NOT NULL,
+        registros INTEGER NOT NULL,
+        exitosos INTEGER NOT NULL,
+        omitidos INTEGER NOT NULL,
+        errores INTEGER NOT NULL,
+        usuario TEXT NOT NULL
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_migration_history_usuario ON migration_history(usuario, id)",
+    "CREATE INDEX IF NOT EXISTS idx_migration_history_tipo ON migration_history(tipo, id)",
+    # Errores por fila de cada migración (fila 1 = primera fila de datos)
+    """
+    CREATE TABLE IF NOT EXISTS migration_errors (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        migracion_id INTEGER NOT NULL,
+        fila INTEGER,
+        campo TEXT,
+        motivo TEXT NOT NULL,
+        FOREIGN KEY (migracion_id) REFERENCES migration_state(id)
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_migration_errors_migracion ON migration_errors(migracion_id, fila)",
+    "CREATE INDEX IF NOT EXISTS idx_migration_errors_pagina ON migration_errors(migracion_id, id)",
+    # Resumen académico materializado: sumas y conteos de notas finales por
+    # semestre y por estudiante, incluidos los semestres ya archivados
+    """
+    CREATE TABLE IF NOT EXISTS resumen_semestres (
+        semester_id INTEGER PRIMARY KEY,
+        student_id INTEGER NOT NULL,
+        semestre INTEGER NOT NULL,
+        año INTEGER NOT NULL,
+        suma REAL NOT NULL DEFAULT 0,
+        materias INTEGER NOT NULL DEFAULT 0,
+        aprobadas INTEGER NOT NULL DEFAULT 0
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS resumen_estudiantes (
+        student_id INTEGER PRIMARY KEY,
+        suma REAL NOT NULL DEFAULT 0,
+        materias INTEGER NOT NULL DEFAULT 0,
+        aprobadas INTEGER NOT NULL DEFAULT 0,
+        promedio REAL,
+        ultima_actividad TIMESTAMP
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_resumen_semestres_student ON resumen_semestres(student_id)",
+    "CREATE INDEX IF NOT EXISTS idx_resumen_promedio ON resumen_estudiantes(promedio)",
+]
+
+# Columnas añadidas después de crear la tabla; las bases viejas las reciben con ALTER TABLE
+COLUMNAS_AGREGADAS = {
+    "migration_history": [
+        ("migracion_id", "INTEGER"),
+        ("modo", "TEXT"),
+        ("duracion", "REAL"),
+        ("filas_por_segundo", "REAL"),
+        ("memoria_pico_kb", "INTEGER"),
+    ],
+    # Solicitud que ejecuta la migración; su latido es la columna actualizado
+    "migration_state": [
+        ("propietario", "TEXT"),
+    ],
+}
+
+ESQUEMA_ARCHIVO = [
+    # Mismas columnas que en la base principal; los ids se conservan
+    """
+    CREATE TABLE IF NOT EXISTS semesters (
+        id INTEGER PRIMARY KEY,
+        student_id INTEGER NOT NULL,
+        semestre INTEGER NOT NULL,
+        año INTEGER NOT NULL,
+        estado TEXT DEFAULT 'activo'
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS subjects (
+        id INTEGER PRIMARY KEY,
+        semester_id INTEGER NOT NULL,
+        nombre TEXT NOT NULL,
+        nota_final REAL
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS evaluations (
+        id INTEGER PRIMARY KEY,
+        subject_id INTEGER NOT NULL,
+        nombre TEXT NOT NULL,
+        nota REAL NOT NULL,
+        porcentaje INTEGER NOT NULL
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_semesters_student ON semesters(student_id)",
+    "CREATE INDEX IF NOT EXISTS idx_subjects_semester ON subjects(semester_id)",
+    "CREATE INDEX IF NOT EXISTS idx_evaluations_subject ON evaluations(subject_id)",
+]
+
+# Vistas temporales sobre datos activos y archivados (archivo adjunto como "archivo")
+VISTAS_HISTORICO = [
+    f"""
+    CREATE TEMP VIEW todos_{tabla} AS
+    SELECT *, 0 AS archivado FROM main.{tabla}
+    UNION ALL
+    SELECT *, 1 AS archivado FROM archivo.{tabla}
+    """
+    for tabla in ("semesters", "subjects", "evaluations")
+]
+
+# Ids de los semestres que se archivan en cada lote
+TABLA_LOTE_ARCHIVO = "CREATE TEMP TABLE lote_archivo (id INTEGER PRIMARY KEY)"
+
+def crear_esquema(conn, esquema):
+    """Run an ESQUEMA_* list and add any COLUMNAS_AGREGADAS missing from its tables."""
+    for sentencia in esquema:
+        conn.execute(sentencia)
+    for tabla, columnas in COLUMNAS_AGREGADAS.items():
+        existentes = {fila[1] for fila in conn.execute(f"PRAGMA table_info({tabla})")}
+        if not existentes:
+            continue
+        for columna, definicion in columnas:
+            if columna not in existentes:
+                conn.execute(f"ALTER TABLE {tabla} ADD COLUMN {columna} {definicion}")
+
+# ---------- USUARIOS Y SESIONES ----------
+USUARIO_POR_EMAIL = Consulta("usuario_por_email", """
+    SELECT id, password_hash FROM users WHERE email = ?
+""", base="usuarios")
+
+USUARIO_POR_ID = Consulta("usuario_por_id", """
+    SELECT email, password_hash FROM users WHERE id = ?
+""", base="usuarios")
+
+ACTUALIZAR_PASSWORD = Consulta("actualizar_password", """
+    UPDATE users SET password_hash = ? WHERE id = ?
+""", base="usuarios")
+
+SESION_POR_ID = Consulta("sesion_por_id", """
+    SELECT datos, expira FROM sesiones WHERE id = ?
+""", base="usuarios")
+
+GUARDAR_SESION = Consulta("guardar_sesion", """
+    INSERT OR REPLACE INTO sesiones (id, datos, expira) VALUES (?, ?, ?)
+""", base="usuarios")
+
+ELIMINAR_SESION = Consulta("eliminar_sesion", """
+    DELETE FROM sesiones WHERE id = ?
+""", base="usuarios")
+
+PURGAR_SESIONES = Consulta("purgar_sesiones", """
+    DELETE FROM sesiones WHERE expira <= ?
+""", base="usuarios")
+
+CONTAR_SESIONES_ACTIVAS = Consulta("contar_sesiones_activas", """
+    SELECT COUNT(*) as total FROM sesiones WHERE expira > ?
+""", base="usuarios")
+
+# ---------- FEED DE CAMBIOS ----------
+INSERTAR_CAMBIO = Consulta("insertar_cambio", """
+    INSERT INTO change_log (entidad, accion, entidad_id, datos)
+    VALUES (?, ?, ?, ?)
+""")
+
+RECORTAR_CAMBIOS = Consulta("recortar_cambios", """
+    DELETE FROM change_log WHERE id <= ?
+""")
+
+ULTIMO_CAMBIO = Consulta("ultimo_cambio", """
+    SELECT COALESCE(MAX(id), 0) as ultimo FROM change_log
+""")
+
+CAMBIOS_DESDE = Consulta("cambios_desde", """
+    SELECT id, entidad, accion, entidad_id, datos, fecha
+    FROM change_log
+    WHERE id > ?
+    ORDER BY id
+    LIMIT ?
+""", params=(0, 100))
+
+# ---------- ESTUDIANTES ----------
+ESTUDIANTE_POR_ID = Consulta("estudiante_por_id", """
+    SELECT id, nombre, apellido, fecha_nacimiento,
+           telefono, correo, carrera, semestre, created_at
+    FROM estudiantes
+    WHERE id = ?
+""")
+
+ESTUDIANTE_EXISTE = Consulta("estudiante_existe", """
+    SELECT id FROM estudiantes WHERE id = ?
+""")
+
+INSERTAR_ESTUDIANTE = Consulta("insertar_estudiante", """
+    INSERT INTO estudiantes (
+        nombre, apellido, fecha_nacimiento,
+        telefono, correo, carrera, semestre
+    ) VALUES (?, ?, ?, ?, ?, ?, ?)
+""")
+
+# LIMIT -1 devuelve todos
+LISTA_ESTUDIANTES = Consulta("lista_estudiantes", """
+    SELECT id, nombre, apellido, fecha_nacimiento,
+           telefono, correo, carrera, semestre, created_at
+    FROM estudiantes
+    ORDER BY created_at DESC
+    LIMIT ?
+""", params=(-1,), permitir=["SCAN estudiantes USING INDEX idx_estudiantes_created"])
+
+ACTUALIZAR_ESTUDIANTE = Consulta("actualizar_estudiante", """
+    UPDATE estudiantes
+    SET nombre = ?, apellido = ?, fecha_nacimiento = ?,
+        telefono = ?, correo = ?, carrera = ?, semestre = ?
+    WHERE id = ?
+""")
+
+# Actualización parcial: cada columna toma su valor de :cambios (objeto JSON)
+# solo si viene en él. RETURNING devuelve las filas tocadas, así no hace falta
+# comprobar antes que existan ni releerlas después
+_ACTUALIZAR_CAMPOS = """
+    UPDATE estudiantes SET
+        nombre = COALESCE(json_extract(:cambios, '$.nombre'), nombre),
+        apellido = COALESCE(json_extract(:cambios, '$.apellido'), apellido),
+        fecha_nacimiento = COALESCE(json_extract(:cambios, '$.fecha_nacimiento'), fecha_nacimiento),
+        telefono = COALESCE(json_extract(:cambios, '$.telefono'), telefono),
+        correo = COALESCE(json_extract(:cambios, '$.correo'), correo),
+        carrera = COALESCE(json_extract(:cambios, '$.carrera'), carrera),
+        semestre = COALESCE(json_extract(:cambios, '$.semestre'), semestre)
+    WHERE {condicion}
+    RETURNING id, nombre, apellido, fecha_nacimiento,
+              telefono, correo, carrera, semestre, created_at
+"""
+_CAMBIOS_EJEMPLO = '{"semestre": 2}'
+
+ACTUALIZAR_CAMPOS_ESTUDIANTE = Consulta(
+    "actualizar_campos_estudiante", _ACTUALIZAR_CAMPOS.format(condicion="id = :id"),
+    params={"cambios": _CAMBIOS_EJEMPLO, "id": 1}
+)
+
+ACTUALIZAR_CAMPOS_ESTUDIANTES = Consulta(
+    "actualizar_campos_estudiantes",
+    _ACTUALIZAR_CAMPOS.format(condicion="id IN (SELECT value FROM json_each(:ids))"),
+    params={"cambios": _CAMBIOS_EJEMPLO, "ids": "[1, 2, 3]"}, permitir=["SCAN json_each"]
+)
+
+# Por filtro de carrera y/o semestre (p. ej. pasar una cohorte al semestre siguiente)
+ACTUALIZAR_CAMPOS_POR_FILTRO = {
+    (por_carrera, por_semestre): Consulta(
+        "actualizar_campos_por" + ("_carrera" if por_carrera else "") + ("_semestre" if por_semestre else ""),
+        _ACTUALIZAR_CAMPOS.format(condicion=" AND ".join(
+            (["carrera = :carrera"] if por_carrera else []) + (["semestre = :semestre"] if por_semestre else [])
+        )),
+        params={"cambios": _CAMBIOS_EJEMPLO, "carrera": "Medicina", "semestre": 1}
+    )
+    for por_carrera, por_semestre in ((True, False), (False, True), (True, True))
+}
+
+CORREOS_ESTUDIANTES = Consulta("correos_estudiantes", """
+    SELECT correo FROM estudiantes
+""", permitir=["SCAN estudiantes"])
+
+ELIMINAR_ESTUDIANTE = Consulta("eliminar_estudiante", """
+    DELETE FROM estudiantes WHERE id = ?
+""")
+
+# ---------- DETALLE, MATERIAS Y EVALUACIONES ----------
+SEMESTRES_HISTORICO_ESTUDIANTE = Consulta("semestres_historico_estudiante", """
+    SELECT id, semestre, año, estado, archivado
+    FROM todos_semesters
+    WHERE student_id = ?
+    ORDER BY año DESC, semestre DESC
+""", base="historico", permitir=[ORDEN_TEMPORAL])
+
+MATERIAS_HISTORICO_SEMESTRE = Consulta("materias_historico_semestre", """
+    SELECT id, nombre, nota_final
+    FROM todos_subjects
+    WHERE semester_id = ?
+""", base="historico")
+
+EVALUACIONES_HISTORICO_MATERIA = Consulta("evaluaciones_historico_materia", """
+    SELECT nombre, nota, porcentaje
+    FROM todos_evaluations
+    WHERE subject_id = ?
+""", base="historico")
+
+MATERIAS_ESTUDIANTE = Consulta("materias_estudiante", """
+    SELECT s.id as subject_id, s.nombre as materia, sem.semestre, sem.año
+    FROM subjects s
+    JOIN semesters sem ON s.semester_id = sem.id
+    WHERE sem.student_id = ?
+    ORDER BY sem.año DESC, sem.semestre DESC, s.nombre
+""", permitir=[ORDEN_TEMPORAL])
+
+MATERIA_EXISTE = Consulta("materia_existe", """
+    SELECT id FROM subjects WHERE id = ?
+""")
+
+INSERTAR_SEMESTRE = Consulta("insertar_semestre", """
+    INSERT INTO semesters (student_id, semestre, año, estado)
+    VALUES (?, ?, ?, 'activo')
+""")
+
+INSERTAR_MATERIA = Consulta("insertar_materia", """
+    INSERT INTO subjects (semester_id, nombre, nota_final)
+    VALUES (?, ?, ?)
+""")
+
+INSERTAR_EVALUACION = Consulta("insertar_evaluacion", """
+    INSERT INTO evaluations (subject_id, nombre, nota, porcentaje)
+    VALUES (?, ?, ?, ?)
+""")
+
+SEMESTRES_ESTUDIANTE = Consulta("semestres_estudiante", """
+    SELECT id FROM semesters WHERE student_id = ?
+""")
+
+MATERIAS_SEMESTRE = Consulta("materias_semestre", """
+    SELECT id FROM subjects WHERE semester_id = ?
+""")
+
+ELIMINAR_EVALUACIONES_MATERIA = Consulta("eliminar_evaluaciones_materia", """
+    DELETE FROM evaluations WHERE subject_id = ?
+""")
+
+ELIMINAR_MATERIAS_SEMESTRE = Consulta("eliminar_materias_semestre", """
+    DELETE FROM subjects WHERE semester_id = ?
+""")
+
+ELIMINAR_SEMESTRES_ESTUDIANTE = Consulta("eliminar_semestres_estudiante", """
+    DELETE FROM semesters WHERE student_id = ?
+""")
+
+ELIMINAR_EVALUACIONES_ARCHIVADAS = Consulta("eliminar_evaluaciones_archivadas", """
+    DELETE FROM archivo.evaluations WHERE subject_id IN (
+        SELECT s.id FROM archivo.subjects s
+        JOIN archivo.semesters sem ON s.semester_id = sem.id
+        WHERE sem.student_id = ?
+    )
+""", base="historico")
+
+ELIMINAR_MATERIAS_ARCHIVADAS = Consulta("eliminar_materias_archivadas", """
+    DELETE FROM archivo.subjects WHERE semester_id IN (
+        SELECT id FROM archivo.semesters WHERE student_id = ?
+    )
+""", base="historico")
+
+ELIMINAR_SEMESTRES_ARCHIVADOS = Consulta("eliminar_semestres_archivados", """
+    DELETE FROM archivo.semesters WHERE student_id = ?
+""", base="historico")
+
+# ---------- ESTADÍSTICAS DEL DASHBOARD ----------
+# Agregados sobre toda la tabla: el recorrido completo es esperado, pero por
+# un índice que ya entrega las filas agrupadas
+TOTAL_ESTUDIANTES = Consulta("total_estudiantes", """
+    SELECT COUNT(*) as total FROM estudiantes
+""", permitir=["SCAN estudiantes USING COVERING INDEX"])
+
+ESTUDIANTES_POR_CARRERA = Consulta("estudiantes_por_carrera", """
+    SELECT carrera, COUNT(*) as cantidad
+    FROM estudiantes
+    GROUP BY carrera
+    ORDER BY cantidad DESC
+""", permitir=["SCAN estudiantes USING COVERING INDEX idx_estudiantes_carrera", ORDEN_TEMPORAL])
+
+ESTUDIANTES_POR_SEMESTRE = Consulta("estudiantes_por_semestre", """
+    SELECT semestre, COUNT(*) as cantidad
+    FROM estudiantes
+    GROUP BY semestre
+    ORDER BY semestre
+""", permitir=["SCAN estudiantes USING COVERING INDEX idx_estudiantes_semestre"])
+
+PROMEDIO_POR_CARRERA = Consulta("promedio_por_carrera", """
+    SELECT e.carrera, AVG(s.nota_final) as promedio
+    FROM estudiantes e
+    LEFT JOIN semesters sem ON e.id = sem.student_id
+    LEFT JOIN subjects s ON sem.id = s.semester_id
+    WHERE s.nota_final IS NOT NULL
+    GROUP BY e.carrera
+""", permitir=["SCAN e USING COVERING INDEX idx_estudiantes_carrera"])
+
+MATERIAS_DIFICILES = Consulta("materias_dificiles", """
+    SELECT s.nombre, AVG(s.nota_final) as promedio, COUNT(*) as estudiantes
+    FROM subjects s
+    WHERE s.nota_final IS NOT NULL
+    GROUP BY s.nombre
+    HAVING COUNT(*) >= 1
+    ORDER BY promedio ASC
+    LIMIT 5
+""", permitir=["SCAN s USING COVERING INDEX idx_subjects_nombre", ORDEN_TEMPORAL])
+
+DISTRIBUCION_NOTAS = Consulta("distribucion_notas", """
+    SELECT
+        CASE
+            WHEN nota_final >= 18 THEN 'Excelente (18-20)'
+            WHEN nota_final >= 15 THEN 'Bueno (15-17)'
+            WHEN nota_final >= 10 THEN 'Aprobado (10-14)'
+            ELSE 'Reprobado (0-9)'
+        END as rango,
+        COUNT(*) as cantidad
+    FROM subjects
+    WHERE nota_final IS NOT NULL
+    GROUP BY rango
+    ORDER BY nota_final DESC
+""", permitir=["SCAN subjects USING COVERING INDEX idx_subjects_nombre", AGRUPACION_TEMPORAL, ORDEN_TEMPORAL])
+
+TOTAL_MATERIAS = Consulta("total_materias", """
+    SELECT COUNT(*) as total FROM subjects
+""", permitir=["SCAN subjects USING COVERING INDEX"])
+
+TOTAL_EVALUACIONES = Consulta("total_evaluaciones", """
+    SELECT COUNT(*) as total FROM evaluations
+""", permitir=["SCAN evaluations USING COVERING INDEX"])
+
+PROMEDIO_GENERAL = Consulta("promedio_general", """
+    SELECT AVG(nota_final) as promedio FROM subjects WHERE nota_final IS NOT NULL
+""", permitir=["SCAN subjects USING COVERING INDEX idx_subjects_nombre"])
+
+# ---------- RESUMEN ACADÉMICO ----------
+# En el UPDATE de los upserts las columnas sin prefijo conservan el valor
+# anterior a la fila nueva
+SUMAR_RESUMEN_SEMESTRE = Consulta("sumar_resumen_semestre", """
+    INSERT INTO resumen_semestres (semester_id, student_id, semestre, año, suma, materias, aprobadas)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT(semester_id) DO UPDATE SET
+        suma = suma + excluded.suma,
+        materias = materias + excluded.materias,
+        aprobadas = aprobadas + excluded.aprobadas
+""")
+
+SUMAR_RESUMEN_ESTUDIANTE = Consulta("sumar_resumen_estudiante", """
+    INSERT INTO resumen_estudiantes (student_id, suma, materias, aprobadas, promedio, ultima_actividad)
+    VALUES (?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
+    ON CONFLICT(student_id) DO UPDATE SET
+        suma = suma + excluded.suma,
+        materias = materias + excluded.materias,
+        aprobadas = aprobadas + excluded.aprobadas,
+        promedio = (suma + excluded.suma) / NULLIF(materias + excluded.materias, 0),
+        ultima_actividad = excluded.ultima_actividad
+""")
+
+ACTIVIDAD_POR_MATERIA = Consulta("actividad_por_materia", """
+    UPDATE resumen_estudiantes SET ultima_actividad = CURRENT_TIMESTAMP
+    WHERE student_id = (
+        SELECT sem.student_id FROM subjects s
+        JOIN semesters sem ON s.semester_id = sem.id
+        WHERE s.id = ?
+    )
+""")
+
+ELIMINAR_RESUMEN_SEMESTRES = Consulta("eliminar_resumen_semestres", """
+    DELETE FROM resumen_semestres WHERE student_id = ?
+""")
+
+ELIMINAR_RESUMEN_ESTUDIANTE = Consulta("eliminar_resumen_estudiante", """
+    DELETE FROM resumen_estudiantes WHERE student_id = ?
+""")
+
+VACIAR_RESUMEN_SEMESTRES = Consulta("vaciar_resumen_semestres", """
+    DELETE FROM resumen_semestres
+""")
+
+VACIAR_RESUMEN_ESTUDIANTES = Consulta("vaciar_resumen_estudiantes", """
+    DELETE FROM resumen_estudiantes
+""")
+
+RECONSTRUIR_RESUMEN_SEMESTRES = Consulta("reconstruir_resumen_semestres", """
+    INSERT INTO resumen_semestres (semester_id, student_id, semestre, año, suma, materias, aprobadas)
+    SELECT sem.id, sem.student_id, sem.semestre, sem.año,
+           TOTAL(s.nota_final), COUNT(s.nota_final),
+           COUNT(CASE WHEN s.nota_final >= ? THEN 1 END)
+    FROM todos_semesters sem
+    JOIN estudiantes e ON e.id = sem.student_id
+    JOIN todos_subjects s ON s.semester_id = sem.id
+    GROUP BY sem.id
+""", base="historico", params=(10,), permitir=["SCAN", AGRUPACION_TEMPORAL])
+
+RECONSTRUIR_RESUMEN_ESTUDIANTES = Consulta("reconstruir_resumen_estudiantes", """
+    INSERT INTO resumen_estudiantes (student_id, suma, materias, aprobadas, promedio, ultima_actividad)
+    SELECT r.student_id, SUM(r.suma), SUM(r.materias), SUM(r.aprobadas),
+           SUM(r.suma) / NULLIF(SUM(r.materias), 0), e.created_at
+    FROM resumen_semestres r
+    JOIN estudiantes e ON e.id = r.student_id
+    GROUP BY r.student_id
+""", permitir=["SCAN r USING INDEX idx_resumen_semestres_student"])
+
+CONTAR_RESUMEN = Consulta("contar_resumen", """
+    SELECT COUNT(*) FROM resumen_estudiantes
+""", permitir=["SCAN resumen_estudiantes USING COVERING INDEX idx_resumen_promedio"])
+
+RESUMEN_VACIO = Consulta("resumen_vacio", """
+    SELECT 1 FROM resumen_estudiantes LIMIT 1
+""", permitir=["SCAN resumen_estudiantes"])
+
+# Los ids llegan como un arreglo JSON: una sola sentencia para cualquier cantidad
+SEMESTRES_RESUMEN = Consulta("semestres_resumen", """
+    SELECT student_id, semestre, año, suma / NULLIF(materias, 0) AS promedio, materias
+    FROM resumen_semestres
+    WHERE student_id IN (SELECT value FROM json_each(?))
+    ORDER BY año, semestre
+""", params=("[1, 2, 3, 4, 5, 6, 7, 8, 9, 10]",), permitir=["SCAN json_each", ORDEN_TEMPORAL])
+
+RANKING = Consulta("ranking", """
+    SELECT r.student_id, e.nombre, e.apellido, e.carrera,
+           r.promedio, r.materias, r.aprobadas, r.ultima_actividad
+    FROM resumen_estudiantes r
+    JOIN estudiantes e ON e.id = r.student_id
+    WHERE r.promedio IS NOT NULL
+    ORDER BY r.promedio DESC
+    LIMIT ?
+""", params=(10,))
+
+CONTAR_EN_RIESGO = Consulta("contar_en_riesgo", """
+    SELECT COUNT(*) FROM resumen_estudiantes WHERE promedio < ?
+""", params=(10,))
+
+EN_RIESGO = Consulta("en_riesgo", """
+    SELECT r.student_id, e.nombre, e.apellido, e.carrera,
+           r.promedio, r.materias, r.aprobadas, r.ultima_actividad
+    FROM resumen_estudiantes r
+    JOIN estudiantes e ON e.id = r.student_id
+    WHERE r.promedio < ?
+    ORDER BY r.promedio
+    LIMIT ? OFFSET ?
+""", params=(10, 50, 0))
+
+# ---------- ARCHIVO DE HISTORIALES ----------
+VACIAR_LOTE_ARCHIVO = Consulta("vaciar_lote_archivo", """
+    DELETE FROM temp.lote_archivo
+""", base="historico")
+
+LLENAR_LOTE_ARCHIVO = Consulta("llenar_lote_archivo", """
+    INSERT INTO temp.lote_archivo (id)
+    SELECT id FROM main.semesters WHERE estado <> 'activo' LIMIT ?
+""", base="historico", params=(500,),
+    permitir=["SCAN main.semesters USING INDEX idx_semesters_cerrados"])
+
+CONTAR_LOTE_ARCHIVO = Consulta("contar_lote_archivo", """
+    SELECT COUNT(*) FROM temp.lote_archivo
+""", base="historico", permitir=["SCAN lote_archivo"])
+
+ARCHIVAR_EVALUACIONES = Consulta("archivar_evaluaciones", """
+    INSERT OR REPLACE INTO archivo.evaluations (id, subject_id, nombre, nota, porcentaje)
+    SELECT e.id, e.subject_id, e.nombre, e.nota, e.porcentaje
+    FROM main.evaluations e
+    JOIN main.subjects s ON e.subject_id = s.id
+    WHERE s.semester_id IN (SELECT id FROM temp.lote_archivo)
+""", base="historico", permitir=["SCAN lote_archivo"])
+
+ARCHIVAR_MATERIAS = Consulta("archivar_materias", """
+    INSERT OR REPLACE INTO archivo.subjects (id, semester_id, nombre, nota_final)
+    SELECT id, semester_id, nombre, nota_final
+    FROM main.subjects
+    WHERE semester_id IN (SELECT id FROM temp.lote_archivo)
+""", base="historico", permitir=["SCAN lote_archivo"])
+
+ARCHIVAR_SEMESTRES = Consulta("archivar_semestres", """
+    INSERT OR REPLACE INTO archivo.semesters (id, student_id, semestre, año, estado)
+    SELECT id, student_id, semestre, año, estado
+    FROM main.semesters
+    WHERE id IN (SELECT id FROM temp.lote_archivo)
+""", base="historico", permitir=["SCAN lote_archivo"])
+
+BORRAR_EVALUACIONES_LOTE = Consulta("borrar_evaluaciones_lote", """
+    DELETE FROM main.evaluations WHERE subject_id IN (
+        SELECT id FROM main.subjects WHERE semester_id IN (SELECT id FROM temp.lote_archivo)
+    )
+""", base="historico", permitir=["SCAN lote_archivo"])
+
+BORRAR_MATERIAS_LOTE = Consulta("borrar_materias_lote", """
+    DELETE FROM main.subjects WHERE semester_id IN (SELECT id FROM temp.lote_archivo)
+""", base="historico", permitir=["SCAN lote_archivo"])
+
+BORRAR_SEMESTRES_LOTE = Consulta("borrar_semestres_lote", """
+    DELETE FROM main.semesters WHERE id IN (SELECT id FROM temp.lote_archivo)
+""", base="historico", permitir=["SCAN lote_archivo"])
+
+CERRAR_SEMESTRES_ANTERIORES = Consulta("cerrar_semestres_anteriores", """
+    UPDATE semesters SET estado = 'completado' WHERE estado = 'activo' AND año < ?
+""", params=(2024,), permitir=["SCAN semesters"])
+
+# Filas activas y archivadas por tabla, para /api/archivo
+CONTEO_ARCHIVO = {
+    tabla: (
+        Consulta(f"contar_activos_{tabla}", f"SELECT COUNT(*) FROM main.{tabla}",
+                 base="historico", permitir=[f"SCAN {tabla} USING COVERING INDEX"]),
+        Consulta(f"contar_archivados_{tabla}", f"SELECT COUNT(*) FROM archivo.{tabla}",
+                 base="historico", permitir=[f"SCAN {tabla} USING COVERING INDEX"])
+    )
+    for tabla in ("semesters", "subjects", "evaluations")
+}
+
+# ---------- MIGRACIONES ----------
+ESTADO_MIGRACION_POR_HUELLA = Consulta("estado_migracion_por_huella", """
+    SELECT * FROM migration_state WHERE huella = ?
+""")
+
+# El UNIQUE de huella hace que solo una de dos solicitudes simultáneas la registre
+INSERTAR_ESTADO_MIGRACION = Consulta("insertar_estado_migracion", """
+    INSERT INTO migration_state (huella, estado, total, bloque, propietario)
+    VALUES (?, 'en_progreso', 0, ?, ?)
+""")
+
+# Tomar una migración sin dueño o cuyo dueño dejó de dar latidos; si otra
+# solicitud la tomó antes, no devuelve fila
+RECLAMAR_MIGRACION = Consulta("reclamar_migracion", """
+    UPDATE migration_state
+    SET propietario = :propietario, actualizado = CURRENT_TIMESTAMP
+    WHERE id = :id AND estado = 'en_progreso'
+      AND (propietario IS NULL OR actualizado < datetime('now', :vencido))
+    RETURNING *
+""", params={"propietario": "abc", "id": 1, "vencido": "-60 seconds"})
+
+LATIDO_MIGRACION = Consulta("latido_migracion", """
+    UPDATE migration_state SET actualizado = CURRENT_TIMESTAMP
+    WHERE id = ? AND propietario = ?
+""")
+
+LIBERAR_MIGRACION = Consulta("liberar_migracion", """
+    UPDATE migration_state SET propietario = NULL
+    WHERE id = ? AND propietario = ?
+""")
+
+REINICIAR_MIGRACION = Consulta("reiniciar_migracion", """
+    UPDATE migration_state
+    SET total = ?, bloque = ?, bloques_completados = 0, exitosos = 0, omitidos = 0,
+        errores = 0, actualizado = CURRENT_TIMESTAMP
+    WHERE id = ? AND propietario = ?
+""")
+
+# Solo la solicitud dueña avanza o completa la migración
+AVANCE_MIGRACION = Consulta("avance_migracion", """
+    UPDATE migration_state
+    SET bloques_completados = ?, exitosos = ?, omitidos = ?, errores = ?,
+        actualizado = CURRENT_TIMESTAMP
+    WHERE id = ? AND propietario = ?
+""")
+
+COMPLETAR_MIGRACION = Consulta("completar_migracion", """
+    UPDATE migration_state SET estado = 'completada', actualizado = CURRENT_TIMESTAMP
+    WHERE id = ? AND propietario = ?
+""")
+
+INSERTAR_ERROR_MIGRACION = Consulta("insertar_error_migracion", """
+    INSERT INTO migration_errors (migracion_id, fila, campo, motivo)
+    VALUES (?, ?, ?, ?)
+""")
+
+ELIMINAR_ERRORES_MIGRACION = Consulta("eliminar_errores_migracion", """
+    DELETE FROM migration_errors WHERE migracion_id = ?
+""")
+
+INSERTAR_HISTORIAL_MIGRACION = Consulta("insertar_historial_migracion", """
+    INSERT INTO migration_history (
+        fecha, archivo, tipo, registros, exitosos, omitidos, errores, usuario,
+        migracion_id, modo, duracion, filas_por_segundo, memoria_pico_kb
+    ) VALUES (
+        :fecha, :archivo, :tipo, :registros, :exitosos, :omitidos, :errores, :usuario,
+        :migracion_id, :modo, :duracion, :filas_por_segundo, :memoria_pico_kb
+    )
+""")
+
+# Historial por cursor de id, con los filtros opcionales de usuario y tipo
+_HISTORIAL = """
+    SELECT id, fecha, archivo, tipo, registros, exitosos, omitidos, errores, usuario,
+           migracion_id, modo, duracion, filas_por_segundo, memoria_pico_kb
+    FROM migration_history
+    WHERE {filtros}id < ?
+    ORDER BY id DESC
+    LIMIT ?
+"""
+HISTORIAL_MIGRACIONES = {
+    (por_usuario, por_tipo): Consulta(
+        "historial_migraciones" + ("_usuario" if por_usuario else "") + ("_tipo" if por_tipo else ""),
+        _HISTORIAL.format(filtros=("usuario = ? AND " if por_usuario else "") + ("tipo = ? AND " if por_tipo else ""))
+    )
+    for por_usuario in (False, True)
+    for por_tipo in (False, True)
+}
+
+MIGRACION_DE_HISTORIAL = Consulta("migracion_de_historial", """
+    SELECT migracion_id, archivo FROM migration_history WHERE id = ?
+""")
+
+ERRORES_MIGRACION = Consulta("errores_migracion", """
+    SELECT fila, campo, motivo FROM migration_errors
+    WHERE migracion_id = ?
+    ORDER BY fila, id
+""")
+
+PAGINA_ERRORES_MIGRACION = Consulta("pagina_errores_migracion", """
+    SELECT id, fila, campo, motivo FROM migration_errors
+    WHERE migracion_id = ? AND id > ?
+    ORDER BY id
+    LIMIT ?
+""", params=(1, 0, 100))
+
+# ---------- ANALÍTICA COLUMNAR ----------
+# Lecturas completas para la instantánea de analitica.py
+INSTANTANEA_ESTUDIANTES = Consulta("instantanea_estudiantes", """
+    SELECT carrera, semestre FROM estudiantes
+""", base="historico", permitir=["SCAN estudiantes"])
+
+# Materias activas y archivadas por separado: cada una se une a los semestres de su propia base
+INSTANTANEA_MATERIAS = {
+    esquema: Consulta(f"instantanea_materias_{esquema}", f"""
+        SELECT s.nombre, s.nota_final, COALESCE(sem.año, 0), COALESCE(sem.semestre, 0), e.carrera
+        FROM {esquema}.subjects s
+        LEFT JOIN {esquema}.semesters sem ON sem.id = s.semester_id
+        LEFT JOIN main.estudiantes e ON e.id = sem.student_id
+    """, base="historico", permitir=["SCAN s"])
+    for esquema in ("main", "archivo")
+}
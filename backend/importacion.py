@@ -0,0 +1,282 @@
+# Lectura y normalización de archivos de migración.
+# Este módulo no tiene efectos al importarse: lo cargan los procesos del pool
+# de importación, que no deben abrir bases de datos ni arrancar hilos.
+import io
+import os
+import unicodedata
+
+# Función para normalizar texto removiendo tildes/acentos
+def normalizar_texto(texto):
+    """Remove accents/tildes from text for normalization."""
+    if not texto:
+        return texto
+    # Normalize to NFD (decomposed form), then filter out combining marks
+    normalized = unicodedata.normalize('NFD', str(texto))
+    return ''.join(c for c in normalized if unicodedata.category(c) != 'Mn')
+
+# ---------- LECTURA DE ARCHIVOS ----------
+def detectar_separador(muestra):
+    """Guess the CSV/TXT delimiter from the first characters of the file."""
+    if '\t' in muestra:
+        return '\t'
+    if ';' in muestra:
+        return ';'
+    return ','
+
+def leer_archivo(ruta, tipo, **kwargs):
+    """Read a whole staged file into a DataFrame."""
+    import pandas as pd
+
+    if tipo == 'excel':
+        df = pd.read_excel(ruta, engine='openpyxl', **kwargs)
+    elif tipo == 'csv':
+        with open(ruta, 'rb') as f:
+            content = f.read().decode('utf-8', errors='replace')
+        df = pd.read_csv(io.StringIO(content), sep=detectar_separador(content[:1000]), **kwargs)
+    elif tipo == 'dbf':
+        from dbfread import DBF
+        df = pd.DataFrame(iter(DBF(ruta, encoding='latin-1')))
+        if kwargs.get('dtype') is str:
+            df = df.astype(str).where(df.notna())
+    else:
+        raise ValueError("Tipo de archivo no soportado")
+
+    # Limpiar nombres de columnas
+    df.columns = [str(col).strip() for col in df.columns]
+    return df
+
+def filas_de_dataframe(df):
+    """Rows as plain dicts, with missing cells as empty strings."""
+    df = df.fillna('')
+    columnas = list(df.columns)
+    return [dict(zip(columnas, fila)) for fila in df.itertuples(index=False, name=None)]
+
+def columnas_csv(ruta):
+    """Column names and delimiter of a CSV, read from its first bytes."""
+    import pandas as pd
+
+    with open(ruta, 'rb') as f:
+        muestra = f.read(1000).decode('utf-8', errors='replace')
+        f.seek(0)
+        cabecera = f.readline().decode('utf-8', errors='replace')
+    sep = detectar_separador(muestra)
+    df = pd.read_csv(io.StringIO(cabecera), sep=sep, nrows=0)
+    return [str(col).strip() for col in df.columns], sep
+
+def planificar_fragmentos_csv(ruta, cantidad):
+    """Split a CSV into byte ranges that start and end on line boundaries.
+
+    Files containing quotes are returned as a single range, since a quoted
+    field may span lines.
+    """
+    tamano = os.path.getsize(ruta)
+    with open(ruta, 'rb') as f:
+        f.readline()
+        inicio_datos = f.tell()
+
+        if cantidad <= 1:
+            return [(inicio_datos, tamano)]
+
+        for bloque in iter(lambda: f.read(1024 * 1024), b''):
+            if b'"' in bloque:
+                return [(inicio_datos, tamano)]
+
+        paso = max(1, (tamano - inicio_datos) // cantidad)
+        limites = [inicio_datos]
+        for i in range(1, cantidad):
+            f.seek(inicio_datos + i * paso)
+            f.readline()
+            posicion = f.tell()
+            if limites[-1] < posicion < tamano:
+                limites.append(posicion)
+        limites.append(tamano)
+
+    return list(zip(limites[:-1], limites[1:]))
+
+def leer_csv_fragmento(ruta, inicio, fin, columnas, sep):
+    import pandas as pd
+
+    with open(ruta, 'rb') as f:
+        f.seek(inicio)
+        contenido = f.read(fin - inicio).decode('utf-8', errors='replace')
+    if not contenido.strip():
+        return []
+    df = pd.read_csv(io.StringIO(contenido), sep=sep, header=None, names=columnas, dtype=str)
+    return filas_de_dataframe(df)
+
+# ---------- NORMALIZACIÓN ----------
+CAMPOS_REQUERIDOS = ('nombre', 'apellido', 'correo', 'carrera')
+CAMPO_VACIO = "Campo requerido vacío"
+
+def campo_faltante(info):
+    """First required student field that is empty, or None."""
+    for campo in CAMPOS_REQUERIDOS:
+        if not info.get(campo):
+            return campo
+    return None
+
+def valor_texto(row, mapping, campo, options):
+    valor = row.get(mapping.get(campo, ''), '')
+    return valor.strip() if options.get('trimSpaces') else valor
+
+def normalizar_fila_basica(row, mapping, options):
+    """Student fields of a basic-mode row.
+
+    Returns (info, None), or (None, (campo, motivo)) when the row is invalid.
+    """
+    # Extraer datos según mapeo
+    nombre = valor_texto(row, mapping, 'nombre', options)
+    apellido = valor_texto(row, mapping, 'apellido', options)
+    fecha_nacimiento = str(row.get(mapping.get('fecha_nacimiento', ''), '')).strip()
+    telefono = str(row.get(mapping.get('telefono', ''), '')).strip()
+    correo = str(row.get(mapping.get('correo', ''), '')).strip().lower()
+    carrera = valor_texto(row, mapping, 'carrera', options)
+    semestre = row.get(mapping.get('semestre', ''), 1)
+
+    # Convertir semestre a entero
+    try:
+        semestre = int(semestre)
+    except (ValueError, TypeError):
+        semestre = 1
+
+    info = {
+        'nombre': nombre,
+        'apellido': apellido,
+        'fecha_nacimiento': fecha_nacimiento,
+        'telefono': telefono,
+        'correo': correo,
+        'carrera': carrera,
+        'semestre': semestre
+    }
+
+    # Validar campos requeridos
+    campo = campo_faltante(info)
+    if campo:
+        return None, (campo, CAMPO_VACIO)
+    return info, None
+
+def agrupar_filas(rows, mapping, options):
+    """Group complete-mode rows by correo into student -> semester -> subject -> evaluations.
+
+    Returns (grupos, errores): grupos keeps the order in which students first
+    appear and records that row as 'fila'; errores is a list of
+    (fila, campo, motivo) with row indexes relative to this chunk.
+    """
+    grupos = {}
+    errores = []
+
+    for indice, row in enumerate(rows):
+        try:
+            correo = str(row.get(mapping.get('correo', ''), '')).strip().lower()
+            if not correo:
+                errores.append((indice, 'correo', CAMPO_VACIO))
+                continue
+
+            # Extraer info del estudiante (solo la primera vez)
+            if correo not in grupos:
+                semestre_num = row.get(mapping.get('semestre', ''), 1)
+                try:
+                    semestre_num = int(float(str(semestre_num)))
+                except:
+                    semestre_num = 1
+
+                grupos[correo] = {
+                    'info': {
+                        'nombre': valor_texto(row, mapping, 'nombre', options),
+                        'apellido': valor_texto(row, mapping, 'apellido', options),
+                        'fecha_nacimiento': str(row.get(mapping.get('fecha_nacimiento', ''), '')).strip(),
+                        'telefono': str(row.get(mapping.get('telefono', ''), '')).strip(),
+                        'correo': correo,
+                        'carrera': normalizar_texto(valor_texto(row, mapping, 'carrera', options)),
+                        'semestre': semestre_num
+                    },
+                    'semesters': {},
+                    'fila': indice
+                }
+
+            # Extraer datos académicos si existen
+            semestre_num = row.get(mapping.get('semestre', ''), 1)
+            semestre_anio = row.get(mapping.get('semestre_anio', ''), 2024)
+            materia = str(row.get(mapping.get('materia', ''), '')).strip()
+            evaluacion = str(row.get(mapping.get('evaluacion', ''), '')).strip()
+            nota = row.get(mapping.get('nota', ''), 0)
+            porcentaje = row.get(mapping.get('porcentaje', ''), 0)
+
+            try:
+                semestre_num = int(float(str(semestre_num)))
+            except:
+                semestre_num = 1
+
+            try:
+                semestre_anio = int(float(str(semestre_anio)))
+            except:
+                semestre_anio = 2024
+
+            try:
+                nota = float(str(nota))
+            except:
+                nota = 0
+
+            try:
+                porcentaje = int(float(str(porcentaje)))
+            except:
+                porcentaje = 0
+
+            if materia and evaluacion:
+                semestre = grupos[correo]['semesters'].setdefault(
+                    (semestre_num, semestre_anio), {'subjects': {}}
+                )
+                semestre['subjects'].setdefault(materia, []).append({
+                    'evaluacion': evaluacion,
+                    'nota': nota,
+                    'porcentaje': porcentaje
+                })
+        except Exception as e:
+            errores.append((indice, None, str(e)))
+            continue
+
+    return grupos, errores
+
+def fusionar_grupos(destino, grupos, desplazamiento=0):
+    """Merge per-chunk groupings; the first chunk where a student appears wins for info.
+
+    desplazamiento turns the chunk's row indexes into file row indexes.
+    """
+    for correo, datos in grupos.items():
+        actual = destino.get(correo)
+        if actual is None:
+            datos['fila'] += desplazamiento
+            destino[correo] = datos
+            continue
+        for sem_key, sem_data in datos['semesters'].items():
+            materias = actual['semesters'].setdefault(sem_key, {'subjects': {}})['subjects']
+            for materia, evaluaciones in sem_data['subjects'].items():
+                materias.setdefault(materia, []).extend(evaluaciones)
+    return destino
+
+# ---------- TAREA DEL POOL ----------
+def procesar_fragmento(tarea):
+    """Parse (if needed) and normalise one chunk; runs in a worker process."""
+    if 'rows' in tarea:
+        rows = tarea['rows']
+    else:
+        rows = leer_csv_fragmento(
+            tarea['ruta'], tarea['inicio'], tarea['fin'], tarea['columnas'], tarea['sep']
+        )
+
+    if tarea['modo'] == 'complete':
+        grupos, errores = agrupar_filas(rows, tarea['mapping'], tarea['options'])
+        return {'filas': len(rows), 'grupos': grupos, 'errores': errores}
+
+    # Las filas inválidas quedan como None para conservar su posición
+    estudiantes = []
+    errores = []
+    for indice, row in enumerate(rows):
+        try:
+            info, error = normalizar_fila_basica(row, tarea['mapping'], tarea['options'])
+        except Exception as e:
+            info, error = None, (None, str(e))
+        estudiantes.append(info)
+        if error:
+            errores.append((indice,) + error)
+    return {'filas': len(rows), 'estudiantes': estudiantes, 'errores': errores}
@@ -0,0 +1,240 @@
+# Verificación de planes de las consultas del catálogo (consultas.py).
+#
+#   python verificar_consultas.py                 # revisa planes; sale con 1 si hay problemas
+#   python verificar_consultas.py --informe       # además lista cada plan y su tiempo
+#   python verificar_consultas.py --escala 100000 # cantidad de estudiantes sembrados
+#
+# Siembra bases temporales con el esquema del catálogo, ejecuta ANALYZE y pasa
+# cada consulta por EXPLAIN QUERY PLAN: un SCAN o TEMP B-TREE que no esté en
+# su lista `permitir` es un problema. También marca el SQL literal que app.py
+# ejecute sin pasar por el catálogo.
+import argparse
+import ast
+import os
+import random
+import re
+import sqlite3
+import sys
+import tempfile
+import time
+
+import consultas
+
+APP_PY = os.path.join(os.path.dirname(os.path.abspath(__file__)), "app.py")
+
+# Sentencias que pueden quedar en línea: no tienen plan que revisar
+SIN_CATALOGO = ("PRAGMA", "BEGIN", "SAVEPOINT", "RELEASE", "ROLLBACK", "ATTACH", "VACUUM", "ANALYZE")
+
+# Sentencias que en app.py siempre van precedidas de otra (dentro de la misma transacción)
+PREVIAS = {
+    consultas.RECONSTRUIR_RESUMEN_SEMESTRES: consultas.VACIAR_RESUMEN_SEMESTRES,
+    consultas.RECONSTRUIR_RESUMEN_ESTUDIANTES: consultas.VACIAR_RESUMEN_ESTUDIANTES,
+}
+
+CARRERAS = ["Ingenieria Informatica", "Ingenieria de Sistemas", "Medicina",
+            "Derecho", "Administracion", "Contaduria"]
+MATERIAS = [f"Materia {i}" for i in range(40)]
+
+# ---------- BASE SEMBRADA ----------
+def sembrar(directorio, estudiantes):
+    """Create and fill the users, students and archive databases; returns their paths."""
+    rutas = {nombre: os.path.join(directorio, nombre + ".db")
+             for nombre in ("usuarios", "estudiantes", "archivo")}
+    aleatorio = random.Random(42)
+
+    conn = sqlite3.connect(rutas["usuarios"])
+    consultas.crear_esquema(conn, consultas.ESQUEMA_USUARIOS)
+    conn.executemany("INSERT INTO users (email, password_hash) VALUES (?, ?)",
+                     [(f"profesor{i}@universidad.edu", "x") for i in range(20)])
+    ahora = time.time()
+    conn.executemany("INSERT INTO sesiones (id, datos, expira) VALUES (?, ?, ?)",
+                     [(f"s{i}", "{}", ahora + aleatorio.randint(-3600, 3600)) for i in range(2000)])
+    conn.commit()
+    conn.execute("ANALYZE")
+    conn.close()
+
+    conn = sqlite3.connect(rutas["archivo"])
+    consultas.crear_esquema(conn, consultas.ESQUEMA_ARCHIVO)
+    conn.close()
+
+    conn = sqlite3.connect(rutas["estudiantes"])
+    consultas.crear_esquema(conn, consultas.ESQUEMA_ESTUDIANTES)
+    conn.execute("ATTACH DATABASE ? AS archivo", (rutas["archivo"],))
+
+    conn.executemany("""
+        INSERT INTO estudiantes (id, nombre, apellido, fecha_nacimiento, telefono,
+                                 correo, carrera, semestre, created_at)
+        VALUES (?, 'Nombre', 'Apellido', '2000-01-01', '0000', ?, ?, ?, ?)
+    """, (
+        (i, f"est{i}@universidad.edu", aleatorio.choice(CARRERAS), aleatorio.randint(1, 10),
+         f"2024-{aleatorio.randint(1, 12):02d}-{aleatorio.randint(1, 28):02d} 10:00:00")
+        for i in range(1, estudiantes + 1)
+    ))
+
+    # Dos semestres por estudiante; el primero cerrado y, en uno de cada tres, ya archivado
+    semestres, materias, evaluaciones = [], [], []
+    archivados = {"semesters": [], "subjects": [], "evaluations": []}
+    semester_id = subject_id = evaluation_id = 0
+    for student_id in range(1, estudiantes + 1):
+        for orden, anio in enumerate((2023, 2024)):
+            semester_id += 1
+            estado = "completado" if orden == 0 else "activo"
+            destino = archivados if orden == 0 and student_id % 3 == 0 else None
+            fila = (semester_id, student_id, orden + 1, anio, estado)
+            (destino["semesters"] if destino else semestres).append(fila)
+            for nombre in aleatorio.sample(MATERIAS, 5):
+                subject_id += 1
+                fila = (subject_id, semester_id, nombre, round(aleatorio.uniform(0, 20), 2))
+                (destino["subjects"] if destino else materias).append(fila)
+                for numero in range(3):
+                    evaluation_id += 1
+                    fila = (evaluation_id, subject_id, f"Evaluación {numero + 1}",
+                            round(aleatorio.uniform(0, 20), 2), 33)
+                    (destino["evaluations"] if destino else evaluaciones).append(fila)
+
+    for esquema, filas in (("main", (semestres, materias, evaluaciones)),
+                           ("archivo", tuple(archivados.values()))):
+        conn.executemany(f"INSERT INTO {esquema}.semesters VALUES (?, ?, ?, ?, ?)", filas[0])
+        conn.executemany(f"INSERT INTO {esquema}.subjects VALUES (?, ?, ?, ?)", filas[1])
+        conn.executemany(f"INSERT INTO {esquema}.evaluations VALUES (?, ?, ?, ?, ?)", filas[2])
+
+    conn.executemany("INSERT INTO change_log (entidad, accion, entidad_id, datos) VALUES (?, ?, ?, ?)",
+                     (("estudiantes", "update", i, "{}") for i in range(1, min(estudiantes, 10000) + 1)))
+
+    for migracion_id in range(1, 51):
+        conn.execute("INSERT INTO migration_state (huella, estado, total, bloque) VALUES (?, 'completada', 1000, 500)",
+                     (f"{migracion_id:064x}",))
+        conn.execute("""
+            INSERT INTO migration_history (fecha, archivo, tipo, registros, exitosos, omitidos,
+                                           errores, usuario, migracion_id, modo)
+            VALUES ('2024-01-01 10:00', 'archivo.csv', ?, 1000, 900, 50, 50, ?, ?, 'basic')
+        """, (aleatorio.choice(["csv", "excel", "dbf"]), f"profesor{migracion_id % 5}@universidad.edu", migracion_id))
+        conn.executemany("INSERT INTO migration_errors (migracion_id, fila, campo, motivo) VALUES (?, ?, 'correo', 'Campo requerido vacío')",
+                         ((migracion_id, fila) for fila in range(1, 51)))
+    conn.commit()
+
+    # El resumen se llena con las propias sentencias del catálogo
+    for vista in consultas.VISTAS_HISTORICO:
+        conn.execute(vista)
+    conn.execute(consultas.RECONSTRUIR_RESUMEN_SEMESTRES, (10,))
+    conn.execute(consultas.RECONSTRUIR_RESUMEN_ESTUDIANTES)
+    conn.commit()
+
+    conn.execute("ANALYZE")
+    conn.execute("ANALYZE archivo")
+    conn.close()
+    return rutas
+
+def conectar(rutas, base):
+    # Sin transacciones implícitas: medir() abre y descarta las suyas
+    if base == "usuarios":
+        return sqlite3.connect(rutas["usuarios"], isolation_level=None)
+    conn = sqlite3.connect(rutas["estudiantes"], isolation_level=None)
+    if base == "historico":
+        conn.execute("ATTACH DATABASE ? AS archivo", (rutas["archivo"],))
+        for vista in consultas.VISTAS_HISTORICO:
+            conn.execute(vista)
+        conn.execute(consultas.TABLA_LOTE_ARCHIVO)
+        # Lote tomado del final para que LLENAR_LOTE_ARCHIVO no choque con él
+        conn.execute("INSERT INTO temp.lote_archivo (id) SELECT id FROM main.semesters "
+                     "WHERE estado <> 'activo' ORDER BY id DESC LIMIT 500")
+    return conn
+
+# ---------- REVISIÓN ----------
+def parametros(consulta):
+    """Sample parameters: the registered ones, or 1 for each placeholder."""
+    if consulta.params is not None:
+        return consulta.params
+    sin_literales = re.sub(r"'[^']*'", "''", consulta)
+    nombres = re.findall(r":(\w+)", sin_literales)
+    if nombres:
+        return {nombre: 1 for nombre in nombres}
+    return (1,) * sin_literales.count("?")
+
+def pasos_no_permitidos(consulta, plan):
+    for _, _, _, detalle in plan:
+        # Versiones anteriores a 3.36 escriben "SCAN TABLE x"
+        detalle = detalle.replace("SCAN TABLE ", "SCAN ")
+        recorrido = detalle.startswith("SCAN ") and not detalle.startswith("SCAN CONSTANT ROW")
+        if not recorrido and "TEMP B-TREE" not in detalle:
+            continue
+        if not any(detalle == permitido or detalle.startswith(permitido + " ")
+                   for permitido in consulta.permitir):
+            yield detalle
+
+def medir(conn, consulta, params, repeticiones=3):
+    """Best-of-N execution time in ms; writes are rolled back."""
+    mejor = None
+    for _ in range(repeticiones):
+        conn.execute("SAVEPOINT verificacion")
+        if consulta in PREVIAS:
+            conn.execute(PREVIAS[consulta])
+        inicio = time.perf_counter()
+        conn.execute(consulta, params).fetchall()
+        duracion = (time.perf_counter() - inicio) * 1000
+        conn.execute("ROLLBACK TO SAVEPOINT verificacion")
+        conn.execute("RELEASE SAVEPOINT verificacion")
+        mejor = duracion if mejor is None else min(mejor, duracion)
+    return mejor
+
+def sql_fuera_del_catalogo(ruta=APP_PY):
+    """String literals passed straight to execute()/executemany() in app.py."""
+    with open(ruta, encoding="utf-8") as f:
+        arbol = ast.parse(f.read(), ruta)
+    for nodo in ast.walk(arbol):
+        if not (isinstance(nodo, ast.Call) and isinstance(nodo.func, ast.Attribute)
+                and nodo.func.attr in ("execute", "executemany") and nodo.args):
+            continue
+        primero = nodo.args[0]
+        if isinstance(primero, ast.Constant) and isinstance(primero.value, str):
+            texto = primero.value
+        elif isinstance(primero, ast.JoinedStr):
+            texto = "".join(v.value for v in primero.values if isinstance(v, ast.Constant))
+        else:
+            continue
+        if not texto.strip().upper().startswith(SIN_CATALOGO):
+            yield nodo.lineno, " ".join(texto.split())[:80]
+
+def verificar(estudiantes, informe=False):
+    problemas = 0
+
+    for linea, texto in sql_fuera_del_catalogo():
+        print(f"app.py:{linea}: SQL fuera del catálogo: {texto}")
+        problemas += 1
+
+    with tempfile.TemporaryDirectory() as directorio:
+        inicio = time.perf_counter()
+        rutas = sembrar(directorio, estudiantes)
+        print(f"Base sembrada con {estudiantes} estudiantes en {time.perf_counter() - inicio:.1f}s")
+
+        conexiones = {}
+        try:
+            for nombre, consulta in sorted(consultas.CATALOGO.items()):
+                if consulta.base not in conexiones:
+                    conexiones[consulta.base] = conectar(rutas, consulta.base)
+                conn = conexiones[consulta.base]
+                params = parametros(consulta)
+
+                plan = conn.execute("EXPLAIN QUERY PLAN " + consulta, params).fetchall()
+                no_permitidos = list(pasos_no_permitidos(consulta, plan))
+                for paso in no_permitidos:
+                    print(f"{nombre}: paso no permitido en el plan: {paso}")
+                problemas += len(no_permitidos)
+
+                if informe:
+                    print(f"\n{nombre} [{consulta.base}] {medir(conn, consulta, params):.2f} ms")
+                    for _, _, _, detalle in plan:
+                        print(f"    {detalle}")
+        finally:
+            for conn in conexiones.values():
+                conn.close()
+
+    print(f"\n{len(consultas.CATALOGO)} consultas revisadas, {problemas} problemas")
+    return problemas
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Revisa los planes de las consultas del catálogo.")
+    parser.add_argument("--escala", type=int, default=2000, help="estudiantes en la base sembrada")
+    parser.add_argument("--informe", action="store_true", help="muestra cada plan con su tiempo")
+    args = parser.parse_args()
+    sys.exit(1 if verificar(args.escala, args.informe) else 0)